@@ -0,0 +1,355 @@
+import argparse
+import gzip
+import io
+import os
+import random
+import struct
+import tarfile
+import zipfile
+import zlib
+
+# all generators are seeded, so a corpus of the same scale is the same on
+# every machine
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do "
+         "eiusmod tempor incididunt ut labore et dolore magna aliqua").split()
+
+
+def text(rng, length):
+    # plain words, so that no member looks like the magic of some format
+    s = []
+    size = 0
+    while size < length:
+        word = rng.choice(WORDS)
+        s.append(word)
+        size += len(word) + 1
+
+    return " ".join(s)[:length].encode("ascii")
+
+
+def gen_tar(path, scale):
+    rng = random.Random(1)
+
+    with tarfile.open(path, "w", format=tarfile.USTAR_FORMAT) as tar:
+        for i in range(int(2000 * scale)):
+            data = text(rng, rng.randint(1, 64 << 10))
+
+            info = tarfile.TarInfo(f"member/{i:06}.txt")
+            info.size = len(data)
+            info.mtime = 1700000000
+            tar.addfile(info, io.BytesIO(data))
+
+
+def gen_zip(path, scale):
+    rng = random.Random(2)
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        for i in range(int(5000 * scale)):
+            name = f"member/{i:06}.txt"
+            info = zipfile.ZipInfo(name, (2024, 1, 1, 0, 0, 0))
+            info.compress_type = zipfile.ZIP_DEFLATED
+
+            # every tenth member is an archive of its own
+            if i % 10 == 0:
+                data = gzip.compress(text(rng, 4096), mtime=0)
+            else:
+                data = text(rng, rng.randint(1, 16 << 10))
+
+            z.writestr(info, data)
+
+
+def box(typ, data):
+    return struct.pack(">I", 8 + len(data)) + typ + data
+
+
+def full_box(typ, data, version=0, flags=0):
+    return box(typ, struct.pack(">I", (version << 24) | flags) + data)
+
+
+def gen_mp4(path, scale):
+    # a sample table with an entry for every sample of a long movie and an
+    # mdat of several GiB that is a hole in a sparse file
+    samples = int(500000 * scale)
+    mdat_size = int((2 << 30) * scale)
+
+    mvhd = full_box(
+        b"mvhd",
+        struct.pack(">IIII", 0, 0, 1000, samples * 40) +
+        struct.pack(">IH", 0x10000, 0x100) + bytes(10) +
+        struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000) +
+        bytes(24) + struct.pack(">I", 2))
+    tkhd = full_box(
+        b"tkhd",
+        struct.pack(">III", 0, 0, 1) + bytes(4) +
+        struct.pack(">I", samples * 40) + bytes(8) +
+        struct.pack(">HHH", 0, 0, 0) + bytes(2) +
+        struct.pack(">9I", 0x10000, 0, 0, 0, 0x10000, 0, 0, 0, 0x40000000) +
+        struct.pack(">II", 1920 << 16, 1080 << 16),
+        flags=3)
+
+    sample_size = mdat_size // samples
+    stsz = full_box(
+        b"stsz",
+        struct.pack(">II", 0, samples) +
+        struct.pack(f">{samples}I", *([sample_size] * samples)))
+
+    stco = full_box(
+        b"stco",
+        struct.pack(">I", samples) +
+        struct.pack(f">{samples}I", *[(i * sample_size) & 0xffffffff
+                                      for i in range(samples)]))
+
+    stts = full_box(b"stts", struct.pack(">III", 1, samples, 40))
+
+    moov = box(
+        b"moov", mvhd + box(
+            b"trak", tkhd +
+            box(b"mdia", box(b"minf", box(b"stbl", stts + stsz + stco)))))
+
+    with open(path, "wb") as file:
+        file.write(box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2mp41"))
+        file.write(moov)
+
+        # 64-bit box size, the payload is never written
+        file.write(struct.pack(">I4sQ", 1, b"mdat", mdat_size + 16))
+        file.truncate(file.tell() + mdat_size)
+
+
+def pdf_object(obj_id, value, stream=None):
+    if stream is None:
+        return f"{obj_id} 0 obj\n{value}\nendobj\n".encode("latin-1")
+
+    return (f"{obj_id} 0 obj\n{value}\nstream\n".encode("latin-1") + stream +
+            b"\nendstream\nendobj\n")
+
+
+def gen_pdf(path, scale):
+    # a PDF 1.5 with a cross-reference stream, thousands of objects with
+    # compressed content streams and objects packed into object streams
+    rng = random.Random(3)
+    count = int(5000 * scale)
+
+    out = bytearray(b"%PDF-1.5\n%\xe2\xe3\xcf\xd3\n")
+    entries = [(0, 0, 0xffff)]
+
+    for obj_id in range(1, count + 1):
+        offset = len(out)
+
+        if obj_id % 4 == 0:
+            # one object per object stream
+            packed = f"<< /Type /Annot /Index {obj_id} >>".encode("latin-1")
+            header = b"0 "
+            out += pdf_object(
+                obj_id, f"<< /Type /ObjStm /N 1 /First {len(header)}"
+                f" /Length {len(header) + len(packed)} >>", header + packed)
+        elif obj_id % 2 == 0:
+            content = zlib.compress(text(rng, rng.randint(64, 4096)))
+            out += pdf_object(
+                obj_id, f"<< /Length {len(content)} /Filter /FlateDecode >>",
+                content)
+        else:
+            out += pdf_object(
+                obj_id, f"<< /Type /Page /Contents {obj_id + 1} 0 R"
+                f" /MediaBox [0 0 612 792] /Rotate {obj_id % 4 * 90} >>")
+
+        entries.append((1, offset, 0))
+
+    for obj_id in range(4, count + 1, 4):
+        entries.append((2, obj_id, 0))
+
+    xref_id = len(entries)
+    xref_offset = len(out)
+    entries.append((1, xref_offset, 0))
+
+    table = b"".join(struct.pack(">BIH", *entry) for entry in entries)
+    out += pdf_object(
+        xref_id, f"<< /Type /XRef /Size {len(entries)} /W [1 4 2]"
+        f" /Length {len(table)} >>", table)
+    out += f"startxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+
+    with open(path, "wb") as file:
+        file.write(out)
+
+
+def gen_tiff(path, scale):
+    # a single IFD whose strip tables have hundreds of thousands of entries
+    count = int(200000 * scale)
+
+    tags = []
+    data = bytearray()
+
+    def add(tag, field_type, values, fmt):
+        tags.append((tag, field_type, len(values), len(data)))
+        data.extend(struct.pack(f"<{len(values)}{fmt}", *values))
+
+    add(273, 4, [i * 64 for i in range(count)], "I")
+    add(279, 3, [64] * count, "H")
+    add(320, 3, [i & 0xffff for i in range(count)], "H")
+
+    description = b"benchmark " * 1000 + b"\x00"
+    tags.append((270, 2, len(description), len(data)))
+    data.extend(description)
+
+    ifd_offset = 8
+    data_offset = ifd_offset + 2 + len(tags) * 12 + 4
+
+    with open(path, "wb") as file:
+        file.write(b"II*\x00" + struct.pack("<I", ifd_offset))
+        file.write(struct.pack("<H", len(tags)))
+        for tag, field_type, tag_count, offset in tags:
+            file.write(
+                struct.pack("<HHII", tag, field_type, tag_count,
+                            data_offset + offset))
+        file.write(struct.pack("<I", 0))
+        file.write(data)
+
+
+def ogg_page(serial, sequence, packets, flags=0):
+    segments = bytearray()
+    for packet in packets:
+        segments.extend([255] * (len(packet) // 255))
+        segments.append(len(packet) % 255)
+
+    return (b"OggS" + struct.pack("<BBQIII", 0, flags, sequence * 1024, serial,
+                                  sequence, 0) + bytes([len(segments)]) +
+            segments + b"".join(packets))
+
+
+def gen_ogg(path, scale):
+    rng = random.Random(4)
+    pages = int(50000 * scale)
+
+    with open(path, "wb") as file:
+        file.write(
+            ogg_page(1,
+                     0, [
+                         b"\x01vorbis" + struct.pack("<IBIIIIBB", 0, 2, 44100,
+                                                     0, 128000, 0, 0xb8, 1)
+                     ],
+                     flags=0x02))
+        file.write(
+            ogg_page(1, 1, [
+                b"\x03vorbis" + struct.pack("<I", 9) + b"benchmark" +
+                struct.pack("<I", 1) + struct.pack("<I", 12) +
+                b"TITLE=corpus" + b"\x01"
+            ]))
+
+        for sequence in range(2, pages):
+            packets = [
+                rng.randbytes(rng.randint(1, 600))
+                for i in range(rng.randint(1, 8))
+            ]
+            file.write(
+                ogg_page(1,
+                         sequence,
+                         packets,
+                         flags=0x04 if sequence == pages - 1 else 0))
+
+
+def gen_walk(path, scale):
+    # zero-filled firmware-like image with archives scattered through it
+    rng = random.Random(5)
+    size = int((64 << 20) * scale)
+
+    with open(path, "wb") as file:
+        file.truncate(size)
+
+        offset = 4096
+        while offset < size - (64 << 10):
+            if rng.random() < 0.5:
+                blob = gzip.compress(text(rng, rng.randint(1024, 32 << 10)),
+                                     mtime=0)
+            else:
+                b = io.BytesIO()
+                with zipfile.ZipFile(b, "w", zipfile.ZIP_DEFLATED) as z:
+                    for i in range(rng.randint(1, 8)):
+                        z.writestr(
+                            zipfile.ZipInfo(f"{i}.txt", (2024, 1, 1, 0, 0, 0)),
+                            text(rng, rng.randint(1, 8192)))
+                blob = b.getvalue()
+
+            file.seek(offset)
+            file.write(blob)
+            offset += len(blob) + rng.randint(4096, 256 << 10)
+
+
+def gen_directory(path, scale):
+    # many small files of mixed types, measured in files per second
+    rng = random.Random(6)
+    os.makedirs(path, exist_ok=True)
+
+    for i in range(int(2000 * scale)):
+        name = os.path.join(path, f"{i:06}")
+
+        match i % 3:
+            case 0:
+                with open(name + ".gz", "wb") as file:
+                    file.write(gzip.compress(text(rng, 2048), mtime=0))
+            case 1:
+                gen_ogg(name + ".ogg", 0.001)
+            case 2:
+                gen_tiff(name + ".tif", 0.0005)
+
+
+# name -> (generator, file name, ruminant arguments)
+CASES = {
+    "tar": (gen_tar, "tar.tar", []),
+    "zip": (gen_zip, "zip.zip", []),
+    "mp4": (gen_mp4, "mp4.mp4", []),
+    "pdf": (gen_pdf, "pdf.pdf", []),
+    "tiff": (gen_tiff, "tiff.tif", []),
+    "ogg": (gen_ogg, "ogg.ogg", []),
+    "walk": (gen_walk, "walk.bin", ["--walk"]),
+    "directory": (gen_directory, "directory", []),
+}
+
+
+def generate(corpus, name, scale):
+    # generated once per scale and reused afterwards
+    generator, filename, _ = CASES[name]
+
+    directory = os.path.join(corpus, f"scale-{scale}")
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, filename)
+    if not os.path.exists(path):
+        # written under a temporary name so that an interrupted run doesn't
+        # leave a truncated file behind
+        tmp = path + ".tmp"
+        generator(tmp, scale)
+        os.rename(tmp, path)
+
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Generate the benchmark corpus")
+
+    parser.add_argument("cases",
+                        nargs="*",
+                        help="Cases to generate, out of"
+                        f" {', '.join(CASES)} (default: all)")
+
+    parser.add_argument(
+        "--corpus",
+        default=os.path.join(os.path.dirname(__file__), "corpus"),
+        help="Directory for the corpus (default: benchmarks/corpus)")
+
+    parser.add_argument("--scale",
+                        type=float,
+                        default=1,
+                        help="Size of the corpus relative to the default one")
+
+    args = parser.parse_args()
+
+    for name in args.cases:
+        if name not in CASES:
+            parser.error(f"unknown case {name}")
+
+    for name in args.cases or CASES:
+        print(generate(args.corpus, name, args.scale))
+
+
+if __name__ == "__main__":
+    main()
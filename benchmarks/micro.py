@@ -0,0 +1,207 @@
+import argparse
+import gc
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import timeit
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ruminant.buf import Buf  # noqa: E402
+
+# layout of the test data: integers at 0, then NUL-terminated strings, lines
+# and a pattern for search() far behind them
+STRINGS = 1 << 16
+LINES = 1 << 17
+PATTERN = b"\x89needle\x00\xff"
+PATTERN_OFFSET = 3 << 18
+SIZE = 1 << 20
+
+
+def make_data():
+    rng = random.Random(7)
+    data = bytearray(rng.randbytes(SIZE))
+
+    strings = b"".join(
+        rng.choice([b"Make", b"Model", b"Software", b"DateTimeOriginal"]) +
+        b"\x00" for i in range(4096))
+    data[STRINGS:STRINGS + len(strings)] = strings
+
+    lines = b"".join(b"%d 0 obj << /Length %d >>\r\n" % (i, i * 7)
+                     for i in range(2048))
+    data[LINES:LINES + len(lines)] = lines
+
+    # nothing before it may look like the pattern
+    data[:PATTERN_OFFSET] = data[:PATTERN_OFFSET].replace(b"\x89", b"\x88")
+    data[PATTERN_OFFSET:PATTERN_OFFSET + len(PATTERN)] = PATTERN
+
+    return bytes(data)
+
+
+def backends(data, directory):
+    # name -> function opening a fresh Buf on the data
+    path = os.path.join(directory, "data.bin")
+    with open(path, "wb") as file:
+        file.write(data)
+
+    def tmp():
+        file = tempfile.TemporaryFile(dir=directory)
+        file.write(data)
+        file.seek(0)
+        return Buf(file)
+
+    return {
+        "bytes": lambda: Buf(data),
+        "bytesio": lambda: Buf(io.BytesIO(data)),
+        "file": lambda: Buf(open(path, "rb")),
+        "tempfile": tmp
+    }
+
+
+def integer_op(name):
+    return (name, 0, f"buf.{name}()", 256)
+
+
+# name -> (start offset, statement, statements per run)
+OPS = [integer_op(name) for name in ("ru8", "ru16", "ru24", "ru32", "ru64")]
+OPS += [
+    integer_op(name) for name in ("ru8l", "ru16l", "ru24l", "ru32l", "ru64l")
+]
+OPS += [
+    ("peek(4)", 0, "buf.peek(4)", 256),
+    ("peek(64k)", 0, "buf.peek(65536)", 16),
+    ("read(64k)", 0, "buf.read(65536)", 8),
+    ("readview(64k)", 0, "buf.readview(65536)", 8),
+    ("rzs", STRINGS, "buf.rzs()", 256),
+    ("rl", LINES, "buf.rl()", 256),
+    ("search", 0, f"buf.seek(0)\nbuf.search({PATTERN!r})", 1),
+    ("sub", 0, "with buf.sub(16): pass", 256),
+    ("pushunit+popunit", 0, "buf.pushunit()\nbuf.setunit(16)\nbuf.popunit()",
+     256),
+    ("backup+restore", 0, "buf.restore(buf.backup())", 256),
+    ("with buf", 0, "with buf: buf.ru8()", 256),
+    ("with buf x4", 0,
+     "with buf:\n with buf:\n  with buf:\n   with buf: buf.ru8()", 64),
+]
+OPS = {name: (start, stmt, count) for name, start, stmt, count in OPS}
+
+
+def compile_op(start, stmt, count):
+    # the statement unrolled count times after a seek to the start, so that
+    # neither the loop nor the seek are a big part of the measurement
+    return f"buf.seek({start})\n" + (stmt + "\n") * count
+
+
+def time_op(buf, code, count, repeat):
+    timer = timeit.Timer(code, globals={"buf": buf})
+    number, _ = timer.autorange()
+
+    best = min(timer.repeat(repeat, number))
+    return best / (number * count) * 1e9
+
+
+def memory_op(buf, code, count):
+    # tracemalloc only knows the live memory, so what's reported is the
+    # biggest transient allocation of an op (copies show up there) and the
+    # memory an op leaves behind
+    code = compile(code, "<op>", "exec")
+    namespace = {"buf": buf}
+
+    tracemalloc.start()
+    try:
+        exec(code, namespace)
+
+        # garbage in reference cycles only counts once it survives a
+        # collection
+        gc.collect()
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        exec(code, namespace)
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return peak - before, (after - before) / count
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Micro-benchmarks of the Buf primitives")
+
+    parser.add_argument("--filter",
+                        "-k",
+                        default="",
+                        help="Only run ops whose name matches this regex")
+
+    parser.add_argument("--backend",
+                        action="append",
+                        help="Backend to run, out of bytes, bytesio, file and"
+                        " tempfile (can be repeated, default: all)")
+
+    parser.add_argument("--repeat",
+                        "-r",
+                        type=int,
+                        default=5,
+                        help="Timing runs per op, the fastest one counts"
+                        " (default: 5)")
+
+    parser.add_argument("--output",
+                        "-o",
+                        help="File to save the results to as JSON")
+
+    args = parser.parse_args()
+
+    pattern = re.compile(args.filter)
+    data = make_data()
+
+    results = {"type": "micro-benchmark", "ops": []}
+
+    with tempfile.TemporaryDirectory() as directory:
+        bufs = backends(data, directory)
+
+        for backend in args.backend or bufs:
+            if backend not in bufs:
+                parser.error(f"unknown backend {backend}")
+
+            for name, (start, stmt, count) in OPS.items():
+                if not pattern.search(name):
+                    continue
+
+                code = compile_op(start, stmt, count)
+
+                ns = time_op(bufs[backend](), code, count, args.repeat)
+                peak, retained = memory_op(bufs[backend](), code, count)
+
+                results["ops"].append({
+                    "op":
+                    name,
+                    "backend":
+                    backend,
+                    "ns-per-op":
+                    round(ns, 1),
+                    "peak-bytes":
+                    peak,
+                    "retained-bytes-per-op":
+                    round(retained, 1)
+                })
+
+                print(
+                    f"{backend:10} {name:18} {ns:>12.1f} ns/op"
+                    f" {peak:>10} B peak {retained:>8.1f} B retained",
+                    file=sys.stderr)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import platform
+import shlex
+import subprocess
+import sys
+import time
+
+import corpus
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def environment():
+    path = os.environ.get("PYTHONPATH")
+    return os.environ | {
+        "PYTHONPATH": ROOT if not path else ROOT + os.pathsep + path
+    }
+
+
+def measure(argv):
+    # wall time and peak RSS of one run, the output is thrown away but still
+    # has to be written like it would be normally
+    start = time.perf_counter()
+    process = subprocess.Popen(argv,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE,
+                               env=environment())
+    stderr = process.stderr.read()
+    _, status, usage = os.wait4(process.pid, 0)
+    wall = time.perf_counter() - start
+
+    # keep Popen from waiting for the already reaped process
+    process.returncode = os.waitstatus_to_exitcode(status)
+    process.stderr.close()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"{shlex.join(argv)} failed:\n" +
+                           stderr.decode("utf-8", "replace"))
+
+    # ru_maxrss is in KiB on Linux
+    return wall, usage.ru_maxrss * 1024
+
+
+def corpus_size(path):
+    if not os.path.isdir(path):
+        return os.path.getsize(path), 1
+
+    size = 0
+    count = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            size += os.path.getsize(os.path.join(root, file))
+            count += 1
+
+    return size, count
+
+
+def run_case(path, argv, repeat):
+    # the fastest of a few runs, as slower ones only measure noise from the
+    # rest of the system
+    runs = [measure(argv + [path]) for i in range(repeat)]
+    wall = min(wall for wall, rss in runs)
+    rss = max(rss for wall, rss in runs)
+
+    size, count = corpus_size(path)
+    return {
+        "bytes": size,
+        "files": count,
+        "wall-time": round(wall, 6),
+        "mb-per-s": round(size / wall / 1e6, 3),
+        "files-per-s": round(count / wall, 3),
+        "max-rss": rss
+    }
+
+
+def run_startup(argv, repeat, directory):
+    # an empty file, so that this is only the interpreter and the imports
+    os.makedirs(directory, exist_ok=True)
+    empty = os.path.join(directory, "empty")
+    open(empty, "wb").close()
+
+    runs = [measure(argv + [empty]) for i in range(repeat)]
+    return {
+        "wall-time": round(min(wall for wall, rss in runs), 6),
+        "max-rss": max(rss for wall, rss in runs)
+    }
+
+
+IMPORT = """
+import sys
+import time
+
+start = time.perf_counter()
+import ruminant.main
+print(time.perf_counter() - start)
+print(" ".join(m for m in sys.modules if m.startswith("ruminant.modules.")))
+"""
+
+
+def run_import(repeat):
+    # importing the CLI shouldn't pull in any format module, those are only
+    # loaded once a blob of theirs shows up
+    runs = []
+    for i in range(repeat):
+        output = subprocess.run([sys.executable, "-c", IMPORT],
+                                capture_output=True,
+                                check=True,
+                                env=environment()).stdout.decode("utf-8")
+        wall, modules = output.split("\n")[:2]
+        runs.append(float(wall))
+
+    return {
+        "wall-time": round(min(runs), 6),
+        "format-modules": modules.split()
+    }
+
+
+def compare(results, baseline, threshold):
+    # prints the change of every metric and returns whether one of them got
+    # worse by more than threshold
+    metrics = (("wall-time", False), ("max-rss", False), ("mb-per-s", True))
+
+    regressed = False
+    cases = baseline["cases"] | {
+        "startup": baseline["startup"],
+        "import": baseline.get("import", {})
+    }
+    for name, result in (results["cases"] | {
+            "startup": results["startup"],
+            "import": results["import"]
+    }).items():
+        if name not in cases:
+            continue
+
+        for metric, higher_is_better in metrics:
+            if metric not in result or metric not in cases[name]:
+                continue
+
+            old = cases[name][metric]
+            new = result[metric]
+            if old == 0:
+                continue
+
+            change = new / old - 1
+            worse = -change if higher_is_better else change
+
+            mark = ""
+            if worse > threshold:
+                mark = "  REGRESSION"
+                regressed = True
+
+            print(
+                f"{name:12} {metric:12} {old:>14} -> {new:>14}"
+                f" ({change:+.1%}){mark}",
+                file=sys.stderr)
+
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark ruminant on a synthetic corpus")
+
+    parser.add_argument("cases",
+                        nargs="*",
+                        help="Cases to run, out of"
+                        f" {', '.join(corpus.CASES)} (default: all)")
+
+    parser.add_argument(
+        "--corpus",
+        default=os.path.join(os.path.dirname(__file__), "corpus"),
+        help="Directory for the corpus (default: benchmarks/corpus)")
+
+    parser.add_argument("--scale",
+                        type=float,
+                        default=1,
+                        help="Size of the corpus relative to the default one")
+
+    parser.add_argument("--repeat",
+                        "-r",
+                        type=int,
+                        default=3,
+                        help="Runs per case, the fastest one counts"
+                        " (default: 3)")
+
+    parser.add_argument(
+        "--ruminant-args",
+        default="",
+        help="Extra arguments for every run, e.g. \"--jobs 4\"")
+
+    parser.add_argument("--output",
+                        "-o",
+                        help="File to save the results to (default: stdout)")
+
+    parser.add_argument(
+        "--baseline",
+        "-b",
+        help="Results of an earlier run to compare against, exits with 1 if"
+        " anything got worse by more than --threshold")
+
+    parser.add_argument("--threshold",
+                        type=float,
+                        default=0.1,
+                        help="Allowed relative regression (default: 0.1)")
+
+    args = parser.parse_args()
+
+    for name in args.cases:
+        if name not in corpus.CASES:
+            parser.error(f"unknown case {name}")
+
+    argv = [sys.executable, "-m", "ruminant"] + shlex.split(args.ruminant_args)
+
+    results = {
+        "type": "benchmark",
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "scale": args.scale,
+        "ruminant-args": args.ruminant_args,
+        "startup": run_startup(argv, max(args.repeat, 5), args.corpus),
+        "import": run_import(max(args.repeat, 5)),
+        "cases": {}
+    }
+
+    if results["import"]["format-modules"]:
+        print("importing the CLI loads format modules: " +
+              ", ".join(results["import"]["format-modules"]),
+              file=sys.stderr)
+
+    for name in args.cases or corpus.CASES:
+        path = corpus.generate(args.corpus, name, args.scale)
+        _, _, case_args = corpus.CASES[name]
+
+        results["cases"][name] = run_case(path, argv + case_args, args.repeat)
+        print(
+            f"{name:12} {results['cases'][name]['wall-time']:>10.3f}s"
+            f" {results['cases'][name]['mb-per-s']:>10.3f} MB/s",
+            file=sys.stderr)
+
+    if args.output is None:
+        print(json.dumps(results, indent=2))
+    else:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+            file.write("\n")
+
+    if args.baseline is not None:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+
+        if compare(results, baseline, args.threshold):
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
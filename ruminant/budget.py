@@ -0,0 +1,206 @@
+from .buf import Buf
+
+import contextlib
+import contextvars
+import json
+import time
+
+# the budget of the file being chewed
+_budget = contextvars.ContextVar("budget", default=None)
+
+# how many blobs deep the current module call is nested
+_depth = contextvars.ContextVar("depth", default=0)
+
+_instrumented = False
+
+# a worker that is still busy this long after its file ran out of time is
+# killed, as the file is stuck somewhere the budget isn't checked
+KILL_GRACE = 1.0
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+def instrument():
+    # swaps accounting versions of the Buf accessors in, so that nothing is
+    # paid for budgets unless they are enabled
+    global _instrumented
+
+    if _instrumented:
+        return
+
+    _instrumented = True
+
+    read, readview, search = Buf.read, Buf.readview, Buf.search
+
+    def budgeted_read(self, count=None):
+        data = read(self, count)
+
+        budget = _budget.get()
+        if budget is not None:
+            budget.spend(len(data))
+
+        return data
+
+    def budgeted_readview(self, count=None):
+        # buffers without a view fall back to read(), which counts itself
+        if self._view is None:
+            return readview(self, count)
+
+        data = readview(self, count)
+
+        budget = _budget.get()
+        if budget is not None:
+            budget.spend(len(data))
+
+        return data
+
+    def budgeted_search(self, s, buf_length=1 << 24):
+        # the same goes for search()
+        budget = _budget.get()
+        if budget is None or self._data is None:
+            return search(self, s, buf_length)
+
+        pos = self._pos
+        try:
+            return search(self, s, buf_length)
+        finally:
+            budget.spend(max(self._pos - pos, 0))
+
+    Buf.read = budgeted_read
+    Buf.readview = budgeted_readview
+    Buf.search = budgeted_search
+
+
+class Limits(object):
+    # per-file budgets, None means unlimited
+
+    def __init__(self,
+                 timeout=None,
+                 max_bytes_read=None,
+                 max_depth=None,
+                 max_output_size=None):
+        self.timeout = timeout
+        self.max_bytes_read = max_bytes_read
+        self.max_depth = max_depth
+        self.max_output_size = max_output_size
+
+    def key(self):
+        # results chewed with different budgets aren't interchangeable
+        return (f"budget={self.timeout},{self.max_bytes_read},"
+                f"{self.max_depth},{self.max_output_size}")
+
+
+class Budget(object):
+    # what one file has used up so far, shared with the threads chewing its
+    # nested blobs
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.bytes_read = 0
+        self.exceeded = False
+
+        self.deadline = None
+        if limits.timeout is not None:
+            self.deadline = time.monotonic() + limits.timeout
+
+    def spend(self, count):
+        self.bytes_read += count
+
+        limit = self.limits.max_bytes_read
+        if limit is not None and self.bytes_read > limit:
+            self.exceeded = True
+            raise BudgetExceeded(f"read more than {limit} bytes")
+
+        self.check_time()
+
+    def check_time(self):
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            self.exceeded = True
+            raise BudgetExceeded(
+                f"took longer than {self.limits.timeout} seconds")
+
+
+@contextlib.contextmanager
+def scope(limits):
+    # a fresh budget for the file chewed inside of it
+    instrument()
+
+    budget = _budget.set(Budget(limits))
+    depth = _depth.set(0)
+    try:
+        yield
+    finally:
+        _depth.reset(depth)
+        _budget.reset(budget)
+
+
+def enter(limits):
+    # called before a module chews a blob, the token goes to leave()
+    depth = _depth.get()
+    if limits.max_depth is not None and depth > limits.max_depth:
+        raise BudgetExceeded(f"nested more than {limits.max_depth} blobs deep")
+
+    budget = _budget.get()
+    if budget is not None:
+        budget.check_time()
+
+    return _depth.set(depth + 1)
+
+
+def leave(token):
+    _depth.reset(token)
+
+
+def exempt(iterator):
+    # runs every step of iterator without a budget
+    done = object()
+    while True:
+        token = _budget.set(None)
+        try:
+            item = next(iterator, done)
+        finally:
+            _budget.reset(token)
+
+        if item is done:
+            return
+
+        yield item
+
+
+def exceeded():
+    budget = _budget.get()
+    return budget is not None and budget.exceeded
+
+
+def output_size(data):
+    return len(
+        json.dumps(data, ensure_ascii=False,
+                   separators=(",", ":")).encode("utf-8"))
+
+
+def error_entry(e):
+    return {
+        "type": "error",
+        "error-type": type(e).__name__,
+        "error-message": str(e)
+    }
+
+
+def cut_short(data):
+    # whether a blob somewhere in the result ran over its budget, which
+    # depends on more than the file itself, e.g. on how busy the machine was
+    if isinstance(data, dict):
+        if data.get("error-type") == BudgetExceeded.__name__:
+            return True
+
+        return any(cut_short(v) for v in data.values())
+    elif isinstance(data, list):
+        return any(cut_short(v) for v in data)
+
+    return False
+
+
+def kill_timeout(timeout):
+    return None if timeout is None else timeout + KILL_GRACE
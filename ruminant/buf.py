@@ -1,35 +1,164 @@
+import collections
 import io
+import mmap
 import struct
-import uuid
+import threading
 from . import utils
 
 
+class PageCache(object):
+    # LRU cache of aligned pages for sources that can't be mapped
+
+    page_size = 1 << 16
+    max_pages = 256
+
+    def __init__(self, file, page_size=None, max_pages=None):
+        self._file = file
+        if page_size is not None:
+            self.page_size = page_size
+        if max_pages is not None:
+            self.max_pages = max_pages
+
+        self._pages = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        # forked buffers share the cache and the file position with it
+        self._lock = threading.Lock()
+
+    def _page(self, index):
+        page = self._pages.get(index)
+
+        if page is None:
+            self.misses += 1
+
+            self._file.seek(index * self.page_size)
+            page = self._file.read(self.page_size)
+
+            self._pages[index] = page
+            if len(self._pages) > self.max_pages:
+                self._pages.popitem(last=False)
+        else:
+            self.hits += 1
+            self._pages.move_to_end(index)
+
+        return page
+
+    def read(self, pos, count):
+        if count <= 0:
+            return b""
+
+        with self._lock:
+            return self._read(pos, count)
+
+    def _read(self, pos, count):
+        if count > self.page_size:
+            # bulk reads would only evict the small fields we care about
+            self._file.seek(pos)
+            return self._file.read(count)
+
+        index, start = divmod(pos, self.page_size)
+        data = self._page(index)[start:start + count]
+
+        if len(data) < count and start + count > self.page_size:
+            data += self._page(index + 1)[:count - len(data)]
+
+        return data
+
+    def clear(self):
+        self._pages.clear()
+
+
+class Record(object):
+    # named fixed-size layout, decoded with a single read and unpack_from
+    # instead of one read per field
+
+    def __init__(self, fmt, *names):
+        self.struct = struct.Struct(fmt)
+        self.names = names
+        self.size = self.struct.size
+
+        if len(names) != len(self.struct.unpack(bytes(self.size))):
+            raise ValueError("field count doesn't match the layout")
+
+    def unpack(self, data):
+        return dict(zip(self.names, self.struct.unpack_from(data)))
+
+
 class Buf(object):
 
-    def __init__(self, source):
+    def __init__(self, source, cache_pages=None):
+        self._file = None
+        self._data = None
+        self._view = None
+        self._pos = 0
+        self.cache = None
+
+        # container transforms leading from the input file to the underlying
+        # data, None if they aren't known (see modules.derive)
+        self.chain = None
+
         if isinstance(source, io.IOBase):
             self._file = source
+            if isinstance(source, io.BytesIO):
+                # already in memory, getvalue() doesn't even copy it as long
+                # as nobody writes to it
+                self._data = source.getvalue()
+            else:
+                self._data = self._map(source)
+            self._pos = source.tell()
+
+            if self._data is None:
+                self.cache = PageCache(source, max_pages=cache_pages)
+
+                source.seek(0, 2)
+                self._length = source.tell()
+                source.seek(self._pos)
         else:
-            self._file = io.BytesIO(source)
+            # slices of bytes are bytes again, unlike those of a bytearray
+            if not isinstance(source, bytes):
+                source = bytes(source)
 
-        self._offset = 0
+            self._data = source
 
-        pos = self.tell()
-        self.seek(0, 2)
-        self._size = self.tell()
-        self.seek(pos)
+        if self._data is not None:
+            # regular files and in-memory blobs are read through a
+            # memoryview so that reads and sub buffers are plain slices
+            self._view = memoryview(self._data)
+            self._length = len(self._view)
+
+        self._offset = 0
+        self._size = self._length
 
         self.resetunit()
         self._target = self._size
         self._stack = []
         self._backup = []
 
+    @staticmethod
+    def _map(file):
+        try:
+            file.flush()
+            return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            # not a regular file (pipes, BytesIO, ...) or an empty one
+            return None
+
+    def fork(self):
+        # independent position and units on the same data, so that another
+        # thread can read from it at the same time
+        buf = Buf.__new__(Buf)
+        buf.__dict__.update(self.__dict__)
+        buf._stack = list(self._stack)
+        buf._backup = []
+        return buf
+
     @classmethod
-    def of(cls, source):
+    def of(cls, source, cache_pages=None):
         if isinstance(source, cls):
             return source
         else:
-            return cls(source)
+            return cls(source, cache_pages)
 
     def available(self):
         return max(self._size - self.tell(), 0)
@@ -40,12 +169,25 @@ class Buf(object):
     def size(self):
         return self._size
 
-    def peek(self, length):
-        pos = self.tell()
-        data = self._file.read(length)
-        self.seek(pos)
+    def _read(self, count):
+        # slicing the data directly is cheaper for the small fields most
+        # reads are about than a memoryview slice that is then copied,
+        # readview() is there for bulk data
+        pos = self._pos
+        if self._data is not None:
+            data = self._data[pos:pos + count]
+        else:
+            data = self.cache.read(pos, count)
+
+        self._pos = pos + len(data)
         return data
 
+    def peek(self, length):
+        if self._data is not None:
+            return self._data[self._pos:self._pos + length]
+
+        return self.cache.read(self._pos, length)
+
     def skip(self, length):
         if self.unit is not None:
             self.unit = max(self.unit - length, 0)
@@ -77,13 +219,45 @@ class Buf(object):
     def read(self, count=None):
         if count is None:
             self.unit = None
-            return self._file.read(self.available())
+            return self._read(self.available())
+        else:
+            if self.unit is not None:
+                self.unit -= count
+                if self.unit < 0:
+                    self._checkunit()
+
+            # the same as _read(), inlined for the small fields most reads
+            # are about; a count past the end reads nothing, like available()
+            pos = self._pos
+            end = min(pos + count, self._offset + self._size)
+            if self._data is not None:
+                data = self._data[pos:end]
+            else:
+                data = self.cache.read(pos, end - pos)
+
+            self._pos = pos + len(data)
+            return data
+
+    def readview(self, count=None):
+        # like read() but hands out a memoryview without copying for memory
+        # and mmap backed buffers, meant for bulk data like decompressor input
+        if self._view is None:
+            return memoryview(self.read(count))
+
+        pos = self._pos
+        if count is None:
+            self.unit = None
+            count = self.available()
         else:
             if self.unit is not None:
                 self.unit -= count
                 self._checkunit()
 
-            return self._file.read(min(count, self.available()))
+            count = min(count, self.available())
+
+        data = self._view[pos:pos + count]
+        self._pos += len(data)
+        return data
 
     def pushunit(self):
         self._stack.append((self.unit, self._target))
@@ -119,13 +293,24 @@ class Buf(object):
         return line
 
     def tell(self):
-        return self._file.tell() - self._offset
+        return self._pos - self._offset
+
+    def rawtell(self):
+        # position in the underlying data, ignoring sub buffers
+        return self._pos
 
     def seek(self, pos, whence=0):
         if whence == 0:
             pos += self._offset
+        elif whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += self._length
 
-        self._file.seek(pos, whence)
+        if pos < 0:
+            raise ValueError(f"negative seek value {pos}")
+
+        self._pos = pos
 
     def sub(self, size):
         assert size <= self.size(), "sub buffer is bigger than host buffer"
@@ -153,6 +338,20 @@ class Buf(object):
         return self.sub(self.available())
 
     def search(self, s, buf_length=1 << 24):
+        if self._data is not None:
+            start = self._pos
+            end = start + self.available()
+            if self.unit is not None:
+                end = min(end, start + self.unit)
+            index = self._data.find(s, start, end)
+
+            if index < 0:
+                self.skip(end - start)
+                raise ValueError(f"pattern {s.hex()} not found")
+
+            self.skip(index - start)
+            return
+
         buf = b""
         while True:
             chunk = self.read(
@@ -172,6 +371,37 @@ class Buf(object):
                 self.seek(-overread, 1)
                 return
 
+    def rsearch(self, s, max_distance=None, buf_length=1 << 20):
+        # seeks back to the last occurrence of s that starts at or before the
+        # current position and at most max_distance bytes before it, reading
+        # backwards in blocks so that only the tail has to be touched
+        start = self._offset
+        if max_distance is not None:
+            start = max(start, self._pos - max_distance)
+        end = min(self._pos + len(s), self._offset + self._size)
+
+        if self._data is not None:
+            index = self._data.rfind(s, start, end)
+        else:
+            index = -1
+            tail = b""
+            while end > start:
+                block = max(end - buf_length, start)
+                data = self.cache.read(block, end - block) + tail
+                index = data.rfind(s)
+
+                if index >= 0:
+                    index += block
+                    break
+
+                tail = data[:len(s) - 1]
+                end = block
+
+        if index < 0:
+            raise ValueError(f"pattern {s.hex()} not found")
+
+        self._pos = index
+
     def ru8(self):
         return int.from_bytes(self.read(1), "big")
 
@@ -390,16 +620,24 @@ class Buf(object):
 
         s = b""
         while self.pu8():
-            s += self._file.read(1)
+            s += self._read(1)
 
         self.seek(pos)
 
         return utils.decode(s, encoding)
 
+    def rrecord(self, record):
+        return record.unpack(self.read(record.size))
+
+    def precord(self, record):
+        return record.unpack(self.peek(record.size))
+
     def ruuid(self):
+        import uuid
         return str(uuid.UUID(bytes=self.read(16)))
 
     def puuid(self):
+        import uuid
         return str(uuid.UUID(bytes=self.peek(16)))
 
     def __getattr__(self, name):
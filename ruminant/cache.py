@@ -0,0 +1,116 @@
+import hashlib
+import json
+import os
+import sqlite3
+
+
+def source_stamp():
+    # any change to the parsers has to invalidate the stored results, so the
+    # stamp covers the source of the whole package instead of the version
+    h = hashlib.sha256()
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    for path, dirs, files in os.walk(root):
+        dirs.sort()
+        for name in sorted(files):
+            if not name.endswith((".py", ".txt")):
+                continue
+
+            h.update(
+                os.path.relpath(os.path.join(path, name),
+                                root).encode("utf-8"))
+            with open(os.path.join(path, name), "rb") as file:
+                h.update(hashlib.sha256(file.read()).digest())
+
+    return h.hexdigest()
+
+
+class ResultCache(object):
+    # stores (data, blob count) results with blob IDs counted from 0, keyed
+    # by file identity or, with hash_content, by the file's SHA-256
+
+    commit_interval = 1000
+
+    def __init__(self, path, hash_content=False, variant=None):
+        self.path = path
+        self.hash_content = hash_content
+
+        # options the results depend on, e.g. budgets
+        self.variant = variant
+        self.stamp = source_stamp()
+        self.hits = 0
+        self.misses = 0
+        self._pending = 0
+
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS results ("
+                         "key TEXT PRIMARY KEY, stamp TEXT, data TEXT, "
+                         "blobs INTEGER)")
+        self._db.execute("DELETE FROM results WHERE stamp != ?",
+                         (self.stamp, ))
+        self._db.commit()
+
+    def key(self, path, walk):
+        if self.hash_content:
+            h = hashlib.sha256()
+            with open(path, "rb") as file:
+                while True:
+                    blob = file.read(1 << 24)
+                    if len(blob) == 0:
+                        break
+
+                    h.update(blob)
+
+            identity = h.hexdigest()
+        else:
+            st = os.stat(path)
+            identity = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"  # noqa: E501
+
+        key = f"{identity}:{'walk' if walk else 'chew'}"
+        if self.variant is not None:
+            key += f":{self.variant}"
+
+        return key
+
+    def get(self, key):
+        row = self._db.execute(
+            "SELECT data, blobs FROM results WHERE key = ? AND stamp = ?",
+            (key, self.stamp)).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def put(self, key, result):
+        data, count = result
+
+        self._db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+            (key, self.stamp, json.dumps(data, ensure_ascii=False), count))
+
+        self._pending += 1
+        if self._pending >= self.commit_interval:
+            self.commit()
+
+    def commit(self):
+        self._db.commit()
+        self._pending = 0
+
+    def close(self):
+        self.commit()
+        self._db.close()
+
+    def __getstate__(self):
+        # worker processes look results up on a connection of their own,
+        # storing them is left to the parent
+        state = self.__dict__.copy()
+        del state["_db"]
+        state["hits"] = state["misses"] = state["_pending"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._db = sqlite3.connect(self.path)
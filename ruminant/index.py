@@ -0,0 +1,66 @@
+from . import modules, utils
+from .buf import Buf
+import json
+import tempfile
+
+
+def build_index(path, data, ctx):
+    # the sidecar index maps every blob's address to its location: the
+    # container transforms leading from the input file to the data the blob
+    # lives in, and its offset and length in there
+    blobs = {}
+    for blob_id, address in modules.blob_addresses(data).items():
+        if blob_id in ctx.index:
+            blobs[address] = {"blob-id": blob_id} | ctx.index[blob_id]
+
+    return {"type": "index", "file": path, "blobs": blobs}
+
+
+def write_index(path, index):
+    with open(path, "w") as file:
+        json.dump(index, file, ensure_ascii=False)
+
+
+def decode(src, step):
+    buf = Buf(src)
+    buf.seek(step["offset"])
+
+    dst = tempfile.TemporaryFile()
+    match step["codec"]:
+        case "deflate":
+            utils.stream_deflate(buf, dst, step["length"])
+        case "bzip2":
+            utils.stream_bzip2(buf, dst, step["length"])
+        case codec:
+            raise ValueError(f"unknown codec {codec}")
+
+    dst.seek(0)
+    return dst
+
+
+def extract(file, index, address, out):
+    blob = index["blobs"].get(address)
+    if blob is None:
+        raise KeyError(f"no blob at address {address}")
+
+    if blob["chain"] is None:
+        raise ValueError(
+            f"blob at address {address} can't be located without parsing"
+            f" the file again, extract it with --extract {blob['blob-id']}")
+
+    # only the containers on the way to the blob get decoded
+    src = file
+    for step in blob["chain"]:
+        src = decode(src, step)
+
+    buf = Buf(src)
+    buf.seek(blob["offset"])
+
+    length = blob["length"]
+    while length:
+        chunk = buf.readview(min(1 << 24, length))
+        out.write(chunk)
+        length -= len(chunk)
+
+        if len(chunk) == 0:
+            break
@@ -1,11 +1,13 @@
-from . import modules
+from . import budget, index, module, modules, spool
 from .buf import Buf
 import argparse
 import sys
 import json
 import tempfile
 import os
+import pickle
 import re
+import importlib.util
 
 sys.set_int_max_str_digits(0)
 sys.setrecursionlimit(1000000)
@@ -25,73 +27,751 @@ def walk_helper(path, filename_regex):
             yield file
 
 
-def process(file, walk):
+def read_paths(file, separator):
+    # yields the paths as they come in, so that a list that is still being
+    # written is worked on right away
+    rest = b""
+    while True:
+        chunk = file.read1(1 << 16)
+        if len(chunk) == 0:
+            break
+
+        paths = (rest + chunk).split(separator)
+        rest = paths.pop()
+
+        for path in paths:
+            if len(path):
+                yield os.fsdecode(path)
+
+    if len(rest):
+        yield os.fsdecode(rest)
+
+
+def carve(ctx, buf, start, end, gap):
+    # greedily chews the candidates in [start, end) that don't overlap an
+    # earlier hit, yielding (offset, entry) for every successful parse
+    buf.seek(start)
+    blob_id = ctx.blob_id
+
+    # finding the candidates isn't what budgets are for, chewing them is
+    candidates = module.scan(buf, end=end)
+    if ctx.limits is not None:
+        candidates = budget.exempt(candidates)
+
+    try:
+        for offset in candidates:
+            if offset < gap:
+                continue
+
+            entry = None
+            blob_id = ctx.blob_id
+
+            buf.seek(offset)
+            with buf.cut():
+                try:
+                    entry = modules.chew(buf, True, ctx)
+                    assert entry["type"] != "unknown"
+                except budget.BudgetExceeded:
+                    raise
+                except Exception:
+                    entry = None
+
+            if entry is None:
+                # failed attempts shouldn't burn blob IDs
+                ctx.blob_id = blob_id
+                continue
+
+            entry["offset"] = offset
+            yield offset, entry
+            gap = offset + entry["length"]
+            blob_id = ctx.blob_id
+    except budget.BudgetExceeded as e:
+        # scanning or chewing ran out, which leaves everything after the last
+        # hit unchewed
+        if gap < end:
+            ctx.blob_id = blob_id + 1
+            yield gap, {
+                "blob-id": blob_id,
+                "length": end - gap,
+                "offset": gap
+            } | budget.error_entry(e)
+
+
+def carve_region(ctx, buf, start, end):
+    # carves a region with blob IDs counted from 0 for every hit so that the
+    # caller can renumber them, returns (offset, entry, blob count) triples
+    ctx = ctx.spawn()
+
+    hits = []
+    for offset, entry in carve(ctx, buf, start, end, start):
+        hits.append((offset, entry, ctx.blob_id))
+        ctx.blob_id = 0
+
+    return hits
+
+
+worker_ctx = None
+worker_buf = None
+worker_cache = None
+
+
+def init_worker(ctx, path=None, cache=None):
+    global worker_ctx, worker_buf, worker_cache
+
+    # the fork start method doesn't pickle the context, but the round trip
+    # is what gives the worker a thread pool, counters and a sampler of its
+    # own instead of the parent's
+    worker_ctx = pickle.loads(pickle.dumps(ctx))
+    if path is not None:
+        worker_buf = Buf(open(path, "rb"))
+
+    # the same goes for the cache's database connection
+    if cache is not None:
+        worker_cache = pickle.loads(pickle.dumps(cache))
+
+
+def worker_stats():
+    # the worker's counters and profile samples since the last call, merged
+    # by the parent
+    stats = None
+    if worker_ctx.stats is not None:
+        stats = worker_ctx.stats.take()
+
+    samples = None
+    if worker_ctx.sampler is not None:
+        samples = worker_ctx.sampler.take()
+
+    dedup = None
+    if worker_ctx.stats is not None and worker_ctx.memo is not None:
+        dedup = worker_ctx.memo.take_counts()
+
+    return stats, samples, dedup
+
+
+def merge_stats(ctx, stats):
+    stats, samples, dedup = stats
+
+    if stats is not None:
+        ctx.stats.merge(stats)
+
+    if samples is not None:
+        ctx.sampler.merge(samples)
+
+    if dedup is not None:
+        ctx.memo.merge_counts(dedup)
+
+
+def carve_worker(start, end):
+    # budgets count per region here
+    if worker_ctx.limits is None:
+        hits = carve_region(worker_ctx, worker_buf, start, end)
+    else:
+        with budget.scope(worker_ctx.limits):
+            hits = carve_region(worker_ctx, worker_buf, start, end)
+
+    return hits, worker_stats()
+
+
+def carve_parallel(ctx, buf, path, jobs):
+    from concurrent.futures import ProcessPoolExecutor
+
+    # a few regions per worker so that a region full of hits doesn't stall
+    # the whole pool
+    region = max(-(-buf.size() // (jobs * 4)), 1 << 20)
+    regions = [(start, min(start + region, buf.size()))
+               for start in range(0, buf.size(), region)]
+
+    with ProcessPoolExecutor(jobs,
+                             initializer=init_worker,
+                             initargs=(ctx, path)) as pool:
+        futures = [pool.submit(carve_worker, *r) for r in regions]
+
+        gap = 0
+        for (start, end), future in zip(regions, futures):
+            hits, stats = future.result()
+            merge_stats(ctx, stats)
+
+            if gap > start:
+                # the last hit reaches into this region, so the worker's
+                # chain is only valid if it doesn't cover anything past gap
+                reach = start
+                skip = 0
+                for offset, entry, count in hits:
+                    if offset >= gap:
+                        break
+
+                    reach = offset + entry["length"]
+                    skip += 1
+
+                if reach > gap:
+                    hits = carve_region(ctx, buf, gap, end)
+                else:
+                    hits = hits[skip:]
+
+            for offset, entry, count in hits:
+                modules.shift_blob_ids(entry, ctx.blob_id)
+                ctx.blob_id += count
+
+                yield offset, entry
+                gap = offset + entry["length"]
+
+
+def ruminate(ctx, file, walk, jobs=1):
+    # every file gets budgets of its own, file can also be the bytes the
+    # server was sent
+    if ctx.limits is None:
+        return _ruminate(ctx, file, walk, jobs)
+
+    first = ctx.blob_id
+    with budget.scope(ctx.limits):
+        try:
+            data = _ruminate(ctx, file, walk, jobs)
+
+            limit = ctx.limits.max_output_size
+            if limit is not None and budget.output_size(data) > limit:
+                raise budget.BudgetExceeded(
+                    f"output is bigger than {limit} bytes")
+        except budget.BudgetExceeded as e:
+            # ran out before a module got to catch it, or the output as a
+            # whole is too big
+            if isinstance(file, bytes):
+                length = len(file)
+            else:
+                file.seek(0, 2)
+                length = file.tell()
+
+            data = {"blob-id": first, "length": length} | budget.error_entry(e)
+            ctx.blob_id = first + 1
+
+    return data
+
+
+def _ruminate(ctx, file, walk, jobs=1):
     if not walk:
-        return json.dumps(modules.chew(file), indent=2, ensure_ascii=False)
-        return
+        return modules.chew(file, False, ctx)
 
-    buf = Buf(file)
-    unknown = 0
+    buf = Buf(file, ctx.cache_pages)
+
+    if jobs > 1 and not ctx.pinned():
+        hits = carve_parallel(ctx, buf, file.name, jobs)
+    else:
+        hits = carve(ctx, buf, 0, buf.size(), 0)
 
     data = []
-    while buf.available():
-        entry = None
+    gap = 0
+    for offset, entry in hits:
+        if offset > gap:
+            data.append({
+                "type": "unknown",
+                "length": offset - gap,
+                "offset": gap,
+                "blob-id": ctx.blob_id
+            })
+            ctx.blob_id += 1
 
-        with buf:
-            try:
-                entry = modules.chew(file, True)
-                assert entry["type"] != "unknown"
-            except Exception:
-                entry = None
-
-        if entry is not None:
-            if unknown > 0:
-                data.append({
-                    "type": "unknown",
-                    "length": unknown,
-                    "offset": buf.tell() - unknown,
-                    "blob-id": modules.blob_id
-                })
-                modules.blob_id += 1
-                unknown = 0
-
-            data.append(entry)
-            buf.skip(entry["length"])
-        else:
-            unknown += 1
-            buf.skip(1)
+        data.append(entry)
+        gap = offset + entry["length"]
 
-    if unknown > 0:
+    if buf.size() > gap:
         data.append({
             "type": "unknown",
-            "length": unknown,
-            "offset": buf.tell() - unknown,
-            "blob-id": modules.blob_id
+            "length": buf.size() - gap,
+            "offset": gap,
+            "blob-id": ctx.blob_id
         })
 
     for entry in data:
-        for k, v in modules.to_extract:
+        if ctx.index is not None and entry["type"] == "unknown":
+            ctx.index[entry["blob-id"]] = {
+                "offset": entry["offset"],
+                "length": entry["length"],
+                "chain": []
+            }
+
+        for k, v in ctx.to_extract:
             if k == entry["blob-id"]:
                 buf.seek(entry["offset"])
                 with open(v, "wb") as file:
                     length = entry["length"]
 
                     while length:
-                        blob = buf.read(min(1 << 24, length))
+                        blob = buf.readview(min(1 << 24, length))
                         file.write(blob)
                         length -= len(blob)
 
+                        if len(blob) == 0:
+                            break
+
+    if buf.cache is not None and ctx.stats is not None:
+        ctx.stats.count_pages(buf.cache)
+
+    return {"type": "walk", "length": buf.size(), "entries": data}
+
+
+def write_json(data, file=None, prefix="", chunk_size=1 << 16):
+    # streams the indented JSON instead of building it as one string, every
+    # line after the first one is prefixed with prefix
+    if file is None:
+        file = sys.stdout
+
+    encoder = json.JSONEncoder(indent=2,
+                               ensure_ascii=False,
+                               default=spool.default)
+
+    chunks = []
+    length = 0
+    for chunk in encoder.iterencode(data):
+        if prefix:
+            # strings are escaped, so every newline is an indentation one
+            chunk = chunk.replace("\n", "\n" + prefix)
+
+        chunks.append(chunk)
+        length += len(chunk)
+
+        if length >= chunk_size:
+            file.write("".join(chunks))
+            chunks.clear()
+            length = 0
+
+    file.write("".join(chunks))
+
+
+def dump_line(path, data):
+    # one compact object per line for --format ndjson
     return json.dumps({
-        "type": "walk",
-        "length": buf.size(),
-        "entries": data
+        "path": path,
+        "data": data
     },
-                      indent=2,
-                      ensure_ascii=False)
+                      ensure_ascii=False,
+                      separators=(",", ":"))
+
+
+def lookup_cache(cache, path, walk):
+    try:
+        key = cache.key(path, walk)
+    except OSError:
+        return None, None
+
+    return key, cache.get(key)
+
+
+def cacheable(ctx, result):
+    # a result that was cut short by a budget might not be the next time
+    if result is None:
+        return False
+
+    return ctx.limits is None or not budget.cut_short(result[0])
+
+
+def process_serial(ctx, paths, walk, cache=None, jobs=1):
+    for path in paths:
+        if cache is None:
+            try:
+                with open(path, "rb") as fd:
+                    yield path, ruminate(ctx, fd, walk, jobs)
+            except Exception:
+                yield path, None
+
+            continue
+
+        key, result = lookup_cache(cache, path, walk)
+        if result is None:
+            result = process_file(ctx, path, walk, jobs)
+
+            if key is not None and cacheable(ctx, result):
+                cache.put(key, result)
+
+        yield finish_file(ctx, path, result)
+
+
+def process_file(ctx, path, walk, jobs=1):
+    # blob IDs are counted from 0 so that the caller can renumber them
+    ctx = ctx.spawn()
+
+    try:
+        with open(path, "rb") as fd:
+            data = ruminate(ctx, fd, walk, jobs)
+    except Exception:
+        return None
+
+    return data, ctx.blob_id
+
+
+def process_worker(path, walk):
+    # the cache is looked up here so that hashing files for --cache-hash is
+    # spread over the workers too, a miss comes back with the key the parent
+    # stores the result under
+    key = None
+    if worker_cache is not None:
+        key, result = lookup_cache(worker_cache, path, walk)
+
+        if result is not None:
+            return (result, None), worker_stats()
+
+    return (process_file(worker_ctx, path, walk), key), worker_stats()
+
+
+def finish_file(ctx, path, result):
+    if result is None:
+        return path, None
+
+    data, count = result
+    modules.shift_blob_ids(data, ctx.blob_id)
+    ctx.blob_id += count
+
+    return path, data
+
+
+# how many files past the next one to be printed may be read and chewed, so
+# that the results waiting for a slow file don't pile up
+WINDOW = 1024
+
+
+def process_parallel(ctx, paths, walk, jobs, unordered, cache=None):
+    from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+    from concurrent.futures.process import BrokenProcessPool
+    from .workers import WorkerPool, WorkerExited
+    import contextlib
+    import heapq
+
+    timeout = None if ctx.limits is None else ctx.limits.timeout
+
+    def start_pool():
+        if timeout is None:
+            return ProcessPoolExecutor(jobs,
+                                       initializer=init_worker,
+                                       initargs=(ctx, None, cache))
+        else:
+            # a worker stuck somewhere the budget isn't checked is killed
+            return WorkerPool(jobs, init_worker, (ctx, None, cache),
+                              budget.kill_timeout(timeout))
+
+    paths = iter(paths)
+    count = 0
+    names = {}
+    sizes = {}
+
+    # (-size, i) of the files that were read but not submitted yet, largest
+    # first so that a big one doesn't start last and hold up the whole run
+    queued = []
+
+    pending = {}
+    futures = {}
+    index = 0
+    exhausted = False
+
+    # files that were running when a ProcessPoolExecutor worker died, which
+    # breaks the whole pool without saying whose file killed it; they are
+    # tried again one at a time on a new pool, so that the next break is
+    # the fault of the file running alone
+    suspects = []
+    alone = None
+
+    def submit(i):
+        nonlocal pool
+
+        try:
+            future = pool.submit(process_worker, names[i], walk)
+        except BrokenProcessPool:
+            # broke since the last wait(), its futures still come back as
+            # failed
+            pool = stack.enter_context(start_pool())
+            future = pool.submit(process_worker, names[i], walk)
+
+        futures[future] = i, pool
+        return future
+
+    with contextlib.ExitStack() as stack:
+        pool = stack.enter_context(start_pool())
+
+        while True:
+            while not exhausted and count - index < WINDOW:
+                path = next(paths, None)
+                if path is None:
+                    exhausted = True
+                    break
+
+                i = count
+                names[i] = path
+                count += 1
+
+                try:
+                    sizes[i] = os.path.getsize(path)
+                except OSError:
+                    sizes[i] = 0
+
+                heapq.heappush(queued, (-sizes[i], i))
+
+            # more than there are workers, so that none of them waits for the
+            # next file while results are sent back
+            if len(suspects) or alone is not None:
+                if len(futures) == 0:
+                    alone = submit(suspects.pop())
+            else:
+                while len(queued) and len(futures) < 8 * jobs:
+                    submit(heapq.heappop(queued)[1])
+
+            if unordered:
+                for i in list(pending):
+                    yield finish_file(ctx, names.pop(i), pending.pop(i))
+                    index += 1
+            else:
+                while index in pending:
+                    yield finish_file(ctx, names.pop(index),
+                                      pending.pop(index))
+                    index += 1
+
+            if len(futures) == 0:
+                if exhausted and not (queued or pending or suspects):
+                    break
+
+                continue
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, owner = futures.pop(future)
+
+                key = None
+                try:
+                    (pending[i], key), stats = future.result()
+                except BrokenProcessPool as e:
+                    if owner is pool:
+                        pool.shutdown(wait=False)
+                        pool = stack.enter_context(start_pool())
+
+                    if future is not alone:
+                        suspects.append(i)
+                        continue
+
+                    pending[i] = {
+                        "blob-id": 0,
+                        "length": sizes[i]
+                    } | budget.error_entry(e), 1
+                    stats = None, None, None
+                except (budget.BudgetExceeded, WorkerExited) as e:
+                    # the worker was killed or died on this file, which
+                    # shouldn't take the others down with it
+                    pending[i] = {
+                        "blob-id": 0,
+                        "length": sizes[i]
+                    } | budget.error_entry(e), 1
+                    stats = None, None, None
+
+                if future is alone:
+                    alone = None
+
+                del sizes[i]
+                merge_stats(ctx, stats)
+
+                if key is not None and cacheable(ctx, pending[i]):
+                    cache.put(key, pending[i])
+
+
+def print_many(ctx, paths, kind, cache=None):
+    # directory mode and --files-from, prints one entry per file that could
+    # be read
+    ndjson = args.format == "ndjson"
+
+    if not ndjson:
+        print(f"{{\n  \"type\": \"{kind}\",\n  \"files\": [")
+
+    # ndjson streams the paths as they are found, at the cost of a progress
+    # bar without a total
+    if has_tqdm and not ndjson:
+        paths = list(paths)
+
+    # with a timeout even a single file goes to a worker process, which can
+    # be killed if the file gets stuck
+    if (args.jobs > 1 or args.timeout is not None) and not ctx.pinned():
+        results = process_parallel(ctx, paths, args.walk, args.jobs,
+                                   args.unordered, cache)
+    else:
+        results = process_serial(ctx, paths, args.walk, cache)
+
+    if has_tqdm:
+        import tqdm
+
+        results = tqdm.tqdm(results, total=len(paths) if not ndjson else None)
+
+    first = True
+    for file, data in results:
+        if has_tqdm and print_filenames:
+            results.set_postfix_str(os.path.basename(file))
+
+        if data is None:
+            continue
+
+        if ndjson:
+            print(dump_line(file, data), flush=True)
+            continue
+
+        if first:
+            first = False
+        else:
+            print(",")
+
+        print(
+            f"    {{\n      \"path\": {json.dumps(file)},\n      \"data\": ",  # noqa: E501
+            end="")
+        write_json(data, prefix="      ")
+        print("\n    }", end="")
+
+    if not ndjson:
+        print("\n  ]\n}")
+
+
+def extract_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="ruminant extract",
+        description="Extract a blob by its address using a blob index")
+
+    parser.add_argument("file", help="File the index was written for")
+
+    parser.add_argument("address", help="Address of the blob, e.g. 0/files/3")
+
+    parser.add_argument("--index",
+                        metavar="PATH",
+                        help="Blob index to use (default: FILE.index.json)")
+
+    parser.add_argument("--output",
+                        "-o",
+                        default="-",
+                        help="File to write the blob to (default: -)")
+
+    args = parser.parse_args(argv)
+
+    if args.index is None:
+        args.index = args.file + ".index.json"
+
+    with open(args.index, "r") as file:
+        blobs = json.load(file)
+
+    try:
+        with open(args.file, "rb") as file:
+            if args.output == "-":
+                index.extract(file, blobs, args.address, sys.stdout.buffer)
+            else:
+                with open(args.output, "wb") as out:
+                    index.extract(file, blobs, args.address, out)
+    except (KeyError, ValueError) as e:
+        print(e.args[0], file=sys.stderr)
+        exit(1)
+
+
+def add_budget_arguments(parser):
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Stop chewing a file after SECONDS, a worker process that is"
+        " still stuck a second later is killed")
+
+    parser.add_argument(
+        "--max-bytes-read",
+        type=int,
+        metavar="BYTES",
+        help="Stop chewing a file after reading BYTES from it and its nested"
+        " blobs")
+
+    parser.add_argument("--max-depth",
+                        type=int,
+                        metavar="N",
+                        help="Don't chew blobs nested more than N levels deep")
+
+    parser.add_argument(
+        "--max-output-size",
+        type=int,
+        metavar="BYTES",
+        help="Replace the result of a file by an error if its JSON is bigger"
+        " than BYTES")
+
+
+def parse_limits(parser, args):
+    values = (args.timeout, args.max_bytes_read, args.max_depth,
+              args.max_output_size)
+    if all(value is None for value in values):
+        return None
+
+    if args.timeout is not None and args.timeout <= 0:
+        parser.error("--timeout has to be positive")
+
+    for name, value in (("--max-bytes-read",
+                         args.max_bytes_read), ("--max-depth", args.max_depth),
+                        ("--max-output-size", args.max_output_size)):
+        if value is not None and value < 0:
+            parser.error(f"{name} can't be negative")
+
+    return budget.Limits(*values)
+
+
+def serve_main(argv):
+    parser = argparse.ArgumentParser(
+        prog="ruminant serve",
+        description="Keep ruminant loaded and parse the files or bytes sent"
+        " to a Unix socket, one JSON request per line")
+
+    parser.add_argument("--socket",
+                        required=True,
+                        metavar="PATH",
+                        help="Unix socket to listen on")
+
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Number of worker processes (default: number of CPUs)")
+
+    parser.add_argument(
+        "--threads",
+        "-t",
+        type=int,
+        default=0,
+        help="Number of threads per worker for chewing nested blobs in"
+        " parallel (default: off)")
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Chew identical small blobs only once per worker and reuse their"
+        " result")
+
+    # the timeout is the default for requests that don't set one
+    add_budget_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    if args.jobs < 1:
+        parser.error("--jobs has to be at least 1")
+
+    ctx = modules.ChewContext(threads=args.threads,
+                              limits=parse_limits(parser, args))
+    if args.dedup:
+        ctx.memo = modules.ChewMemo()
+
+    from .server import serve
+    import signal
+
+    # a plain kill still removes the socket
+    signal.signal(signal.SIGTERM, lambda sig, frame: exit(0))
+
+    try:
+        serve(args.socket, ctx, args.jobs)
+    except FileExistsError as e:
+        print(e.args[0], file=sys.stderr)
+        exit(1)
+    except KeyboardInterrupt:
+        pass
 
 
 def main():
-    global has_tqdm, args
+    global has_tqdm, print_filenames, args
+
+    if len(sys.argv) > 1 and sys.argv[1] == "extract":
+        return extract_main(sys.argv[2:])
+
+    if len(sys.argv) > 1 and sys.argv[1] == "serve":
+        return serve_main(sys.argv[2:])
 
     if sys.platform == "linux":
         import traceback
@@ -106,10 +786,7 @@ def main():
 
     parser = argparse.ArgumentParser(description="Ruminant parser")
 
-    parser.add_argument("file",
-                        default="-",
-                        nargs="?",
-                        help="File to parse (default: -)")
+    parser.add_argument("file", nargs="?", help="File to parse (default: -)")
 
     parser.add_argument(
         "--extract",
@@ -125,20 +802,114 @@ def main():
         action="store_true",
         help="Walk the file binwalk-style and look for parsable data")
 
+    parser.add_argument(
+        "--jobs",
+        "-j",
+        type=int,
+        default=1,
+        help="Number of worker processes for walk mode or directory mode"
+        " (default: 1)")
+
+    parser.add_argument(
+        "--threads",
+        "-t",
+        type=int,
+        default=0,
+        help="Number of threads for chewing nested blobs like archive members"
+        " in parallel (default: off)")
+
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Print call counts, times and bytes read per module to stderr")
+
+    parser.add_argument(
+        "--page-cache",
+        type=int,
+        metavar="PAGES",
+        help="Number of 64 KiB pages cached per input that can't be mapped,"
+        " like a pipe (default: 256)")
+
+    if sys.platform == "linux":
+        parser.add_argument(
+            "--profile-sample",
+            type=int,
+            metavar="HZ",
+            help="Sample the stacks HZ times per second of CPU time and write"
+            " them folded for flamegraph tools to --profile-output")
+
+        parser.add_argument(
+            "--profile-output",
+            default="ruminant.folded",
+            metavar="PATH",
+            help="File for the folded stacks of --profile-sample (default:"
+            " ruminant.folded)")
+
+    parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="Print files in directory mode as soon as they are done")
+
     parser.add_argument("--extract-all",
                         action="store_true",
                         help="Extract all blobs to blobs/{id}.bin")
 
+    parser.add_argument(
+        "--format",
+        "-f",
+        choices=("json", "ndjson"),
+        default="json",
+        help="Print one JSON document (json) or one line per file as soon as"
+        " it is done (ndjson) (default: json)")
+
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="Write an index of all blob addresses and their locations for"
+        " 'ruminant extract'")
+
+    parser.add_argument(
+        "--index-output",
+        metavar="PATH",
+        help="Where to write the index to (default: FILE.index.json)")
+
+    parser.add_argument(
+        "--dedup",
+        action="store_true",
+        help="Chew identical small blobs only once and reuse their result")
+
+    add_budget_arguments(parser)
+
+    parser.add_argument(
+        "--cache",
+        metavar="PATH",
+        help="Reuse results of unchanged files from the sqlite database at"
+        " PATH")
+
+    parser.add_argument(
+        "--cache-hash",
+        action="store_true",
+        help="Identify cached files by their SHA-256 instead of their inode")
+
     parser.add_argument("--filename-regex",
                         default=".*",
                         nargs="?",
                         help="Filename regex for directory mode")
 
-    has_tqdm = True
-    try:
-        import tqdm
-    except Exception:
-        has_tqdm = False
+    parser.add_argument(
+        "--files-from",
+        metavar="LIST",
+        help="Process the files listed in LIST, one path per line, like a"
+        " directory (- for stdin)")
+
+    parser.add_argument("--null",
+                        "-0",
+                        action="store_true",
+                        help="Paths in --files-from are separated by NUL"
+                        " bytes instead of newlines")
+
+    # tqdm is only imported once there is a progress bar to show
+    has_tqdm = importlib.util.find_spec("tqdm") is not None
 
     if has_tqdm:
         parser.add_argument("--progress",
@@ -156,24 +927,91 @@ def main():
         has_tqdm = args.progress
         print_filenames = args.progress_names
 
+    if args.files_from is not None and args.file is not None:
+        parser.error("a file can't be given together with --files-from")
+
+    if args.file is None:
+        args.file = "-"
+
+    path = args.file
     if args.file == "-":
         args.file = "/dev/stdin"
 
+    ndjson = args.format == "ndjson"
+
+    if args.page_cache is not None and args.page_cache < 1:
+        parser.error("--page-cache has to be positive")
+
+    ctx = modules.ChewContext(threads=args.threads,
+                              limits=parse_limits(parser, args),
+                              cache_pages=args.page_cache)
+
+    if args.stats:
+        from .stats import ModuleStats
+        ctx.stats = ModuleStats()
+
+    if getattr(args, "profile_sample", None):
+        from .sampler import StackSampler
+        ctx.sampler = StackSampler(args.profile_sample)
+        ctx.sampler.start()
+
     if args.extract_all:
-        modules.extract_all = True
+        ctx.extract_all = True
         if not os.path.isdir("blobs"):
             os.mkdir("blobs")
 
     if args.extract is not None:
         for k, v in args.extract:
             try:
-                modules.to_extract.append((int(k), v))
+                ctx.to_extract.append((int(k), v))
             except ValueError:
                 print(f"Cannot parse blob ID {k}", file=sys.stderr)
                 exit(1)
 
-    if args.file == "/dev/stdin":
-        file = tempfile.TemporaryFile()
+    if args.dedup:
+        ctx.memo = modules.ChewMemo()
+
+    if args.index_output is not None:
+        args.index = True
+
+    if args.index:
+        if not os.path.isfile(args.file):
+            print("An index can only be written for a regular file",
+                  file=sys.stderr)
+            exit(1)
+
+        if args.index_output is None:
+            args.index_output = args.file + ".index.json"
+
+        ctx.index = {}
+
+    cache = None
+    if args.cache is not None and (args.file != "/dev/stdin"
+                                   or args.files_from is not None):
+        if not ctx.pinned():
+            from .cache import ResultCache
+            cache = ResultCache(
+                args.cache, args.cache_hash,
+                ctx.limits.key() if ctx.limits is not None else None)
+
+    # results that are only written by write_json() can keep their huge
+    # arrays on disk
+    ctx.spool = not ndjson and cache is None and ctx.index is None
+    if ctx.limits is not None and ctx.limits.max_output_size is not None:
+        ctx.spool = False
+
+    if args.files_from is not None:
+        if args.files_from == "-":
+            listing = sys.stdin.buffer
+        else:
+            listing = open(args.files_from, "rb")
+
+        with listing:
+            print_many(ctx, read_paths(listing, b"\0" if args.null else b"\n"),
+                       "file-list", cache)
+    elif args.file == "/dev/stdin":
+        # named so that walk mode workers can open it on their own
+        tmp = tempfile.NamedTemporaryFile()
 
         try:
             fd = open("/dev/stdin", "rb")
@@ -186,59 +1024,65 @@ def main():
                 if len(blob) == 0:
                     break
 
-                file.write(blob)
+                tmp.write(blob)
 
-        file.seek(0)
-        with file:
-            print(process(file, args.walk))
+        tmp.flush()
+        with tmp, open(tmp.name, "rb") as file:
+            if ndjson:
+                print(
+                    dump_line(path, ruminate(ctx, file, args.walk, args.jobs)))
+            else:
+                write_json(ruminate(ctx, file, args.walk, args.jobs))
+                print()
     else:
-        if not os.path.isfile(args.file):
-            print("{\n  \"type\": \"directory\",\n  \"files\": [")
+        # with a timeout a file is chewed by a worker process that can be
+        # killed if the file gets stuck, a parallel walk can't run in one
+        isolate = (args.timeout is not None and not ctx.pinned()
+                   and not (args.walk and args.jobs > 1))
 
+        if not os.path.isfile(args.file):
             filename_regex = re.compile(args.filename_regex)
+            print_many(ctx, walk_helper(args.file, filename_regex),
+                       "directory", cache)
 
-            if has_tqdm:
-                paths = []
-                for root, _, files in os.walk(args.file):
-                    for file in files:
-                        file = os.path.join(root, file)
-
-                        if filename_regex.match(file) is None:
-                            continue
+        elif cache is not None or isolate:
+            if isolate:
+                results = process_parallel(ctx, [args.file], args.walk, 1,
+                                           False, cache)
+            else:
+                results = process_serial(ctx, [args.file], args.walk, cache,
+                                         args.jobs)
 
-                        paths.append(file)
+            for _, data in results:
+                if ndjson:
+                    print(dump_line(path, data))
+                else:
+                    write_json(data)
+                    print()
+        else:
+            with open(args.file, "rb") as file:
+                data = ruminate(ctx, file, args.walk, args.jobs)
 
-                paths = tqdm.tqdm(paths)
+            if ndjson:
+                print(dump_line(path, data))
             else:
-                paths = walk_helper(args.file, filename_regex)
+                write_json(data)
+                print()
 
-            first = True
-            for file in paths:
-                if has_tqdm and print_filenames:
-                    paths.set_postfix_str(os.path.basename(file))
+            if ctx.index is not None:
+                index.write_index(args.index_output,
+                                  index.build_index(args.file, data, ctx))
 
-                try:
-                    with open(file, "rb") as fd:
-                        if first:
-                            first = False
-                        else:
-                            print(",")
-
-                        print(
-                            f"    {{\n      \"path\": {json.dumps(file)},\n      \"data\": {{"  # noqa: E501
-                        )
-
-                        print("\n".join([
-                            "      " + x
-                            for x in process(fd, args.walk).split("\n")[1:-1]
-                        ]))
-
-                        print("      }\n    }", end="")
-                except Exception:
-                    pass
+    if cache is not None:
+        cache.close()
 
-            print("\n  ]\n}")
+    if ctx.stats is not None:
+        report = ctx.stats.report()
+        if ctx.memo is not None:
+            report["dedup"] = ctx.memo.report()
 
-        else:
-            with open(args.file, "rb") as file:
-                print(process(file, args.walk))
+        print(json.dumps(report, indent=2), file=sys.stderr)
+
+    if ctx.sampler is not None:
+        ctx.sampler.stop()
+        ctx.sampler.write(args.profile_output)
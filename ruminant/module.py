@@ -1,17 +1,214 @@
+import heapq
+import importlib
+import re
+
 modules = []
+_signatures = None
+_scanner = None
+
+# (package, class name) -> index of the LazyModule standing in for the class
+_lazy = {}
+
+
+class LazyModule(object):
+    # stands in for a module class until a blob matches one of its magics, so
+    # that the package defining it is only imported when it's needed
+
+    def __init__(self, package, name, magic, identify=False, scan=[]):
+        self.package = package
+        self.__name__ = name
+        self.MAGIC = magic
+        self.SCAN = scan
+        self.has_identify = identify
+
+
+def register_lazy(package, name, magic, identify=False, scan=[]):
+    global _signatures, _scanner
+
+    _lazy[(package, name)] = len(modules)
+    modules.append(LazyModule(package, name, magic, identify, scan))
+    _signatures = None
+    _scanner = None
 
 
 def register(cls):
+    global _signatures, _scanner
+
+    index = _lazy.pop((cls.__module__, cls.__name__), None)
+    if index is not None:
+        # takes the place of its stand-in, which keeps the priority and the
+        # signature tables valid as long as they agree on the magics and on
+        # whether identify() has to be asked
+        lazy = modules[index]
+        if (lazy.MAGIC, lazy.SCAN) != (cls.MAGIC, cls.SCAN):
+            raise ValueError(f"signature table entry of {cls.__name__} "
+                             "doesn't match its MAGIC and SCAN")
+        if lazy.has_identify != has_identify(cls):
+            raise ValueError(f"signature table entry of {cls.__name__} "
+                             "doesn't match whether it has an identify()")
+
+        modules[index] = cls
+        return cls
+
     modules.append(cls)
+    _signatures = None
+    _scanner = None
+    return cls
+
+
+def load(index):
+    cls = modules[index]
+    if isinstance(cls, LazyModule):
+        importlib.import_module(cls.package)
+
+        cls = modules[index]
+        if isinstance(cls, LazyModule):
+            raise ImportError(
+                f"{cls.package} doesn't register a module {cls.__name__}")
+
     return cls
 
 
+def has_identify(cls):
+    if isinstance(cls, LazyModule):
+        return cls.has_identify
+
+    return cls.identify is not RuminantModule.identify
+
+
+def _build_signatures():
+    # group the magics by position so that a lookup only needs one dict
+    # access per distinct (offset, length) pair
+    groups = {}
+    fallback = []
+    for index, cls in enumerate(modules):
+        for offset, magic in cls.MAGIC:
+            groups.setdefault((offset, len(magic)),
+                              {}).setdefault(magic, []).append(index)
+
+        if has_identify(cls):
+            fallback.append(index)
+
+    length = max([offset + length for offset, length in groups], default=0)
+
+    return length, list(groups.items()), fallback
+
+
+def lookup(buf, ctx={}):
+    global _signatures
+
+    if _signatures is None:
+        _signatures = _build_signatures()
+
+    length, groups, fallback = _signatures
+
+    head = buf.peek(length)
+
+    candidates = set()
+    for (offset, length), table in groups:
+        hits = table.get(head[offset:offset + length])
+        if hits is not None:
+            candidates.update(hits)
+
+    for index in sorted(candidates.union(fallback)):
+        if index in candidates or load(index).identify(buf, ctx):
+            return load(index)
+
+    return None
+
+
+def _build_scanner():
+    magics = {}
+    for cls in modules:
+        for offset, magic in cls.MAGIC + cls.SCAN:
+            magics.setdefault(magic, set()).add(offset)
+
+    # the regex only reports the longest magic at each position, so every
+    # magic also carries the offsets of all magics that are a prefix of it
+    offsets = {}
+    for magic in magics:
+        offsets[magic] = sorted({
+            offset
+            for other in magics if magic.startswith(other)
+            for offset in magics[other]
+        })
+
+    pattern = re.compile(
+        b"(?=(" + b"|".join(
+            re.escape(magic)
+            for magic in sorted(magics, key=len, reverse=True)) + b"))",
+        re.DOTALL)
+
+    overlap = max([len(magic) for magic in magics], default=1) - 1
+    max_offset = max([max(offset) for offset in offsets.values()], default=0)
+
+    return pattern, offsets, overlap, max_offset
+
+
+def scan(buf, chunk_size=1 << 24, end=None):
+    # yields every position from the current one on (and before end, if
+    # given) at which a registered MAGIC could start, in ascending order
+    global _scanner
+
+    if _scanner is None:
+        _scanner = _build_scanner()
+
+    pattern, offsets, overlap, max_offset = _scanner
+
+    start = buf.tell()
+    base = start
+    heap = []
+    last = None
+
+    # magics starting past this can't belong to a candidate before end
+    limit = None if end is None else end + max_offset
+
+    while True:
+        count = chunk_size
+        if limit is not None:
+            count = max(min(count, limit - base), 0)
+
+        with buf:
+            buf.resetunit()
+            buf.seek(base)
+            data = buf.readview(count + overlap)
+
+        for match in pattern.finditer(data):
+            if match.start() >= count:
+                break
+
+            for offset in offsets[match.group(1)]:
+                candidate = base + match.start() - offset
+                if candidate >= start and (end is None or candidate < end):
+                    heapq.heappush(heap, candidate)
+
+        base += count
+        done = len(data) <= count or (limit is not None and base >= limit)
+
+        # later chunks can't produce candidates before base - max_offset
+        while len(heap) and (done or heap[0] < base - max_offset):
+            candidate = heapq.heappop(heap)
+            if candidate != last:
+                last = candidate
+                yield candidate
+
+        if done:
+            break
+
+
 class RuminantModule(object):
+    # list of (offset, bytes) pairs, any of which identifies the format
+    MAGIC = []
+
+    # (offset, bytes) pairs that walk mode also tries, but that only
+    # identify() can confirm
+    SCAN = []
 
     def __init__(self, buf):
         self.buf = buf
 
     def identify(buf, ctx={}):
+        # only needed for formats that can't be described by MAGIC alone
         return False
 
     def chew(self):
@@ -1,113 +1,572 @@
-from .. import module
+from .. import budget, module
 from ..buf import Buf
+from ..spool import Spool
 
-import traceback
+import collections
+import contextvars
+import copy
+import functools
+import threading
 import os
 
-to_extract = []
-extract_all = False
-blob_id = 0
+
+class ChewContext(object):
+    # state of one chew() call tree: the blob ID allocator, extraction
+    # requests and options, so that independent calls can run concurrently
+
+    def __init__(self,
+                 to_extract=None,
+                 extract_all=False,
+                 memo=None,
+                 index=False,
+                 threads=0,
+                 stats=None,
+                 limits=None,
+                 spool=False,
+                 cache_pages=None):
+        self.blob_id = 0
+        self.to_extract = to_extract if to_extract is not None else []
+        self.extract_all = extract_all
+        self.memo = memo
+
+        # size of the pool chew_all() runs nested blobs on, created on first
+        # use and shared by all contexts spawned from this one
+        self.threads = threads
+        self._pool = None
+
+        # ModuleStats the module calls are counted in, if enabled
+        self.stats = stats
+
+        # budget.Limits every file is chewed under, if any
+        self.limits = limits
+
+        # whether huge arrays in the result may be kept in a Spool, which
+        # only write_json() can read
+        self.spool = spool
+
+        # size of the page cache of inputs that can't be mapped, None for
+        # PageCache.max_pages
+        self.cache_pages = cache_pages
+
+        # StackSampler profiling the run, only used to start and collect the
+        # sampling in worker processes
+        self.sampler = None
+
+        # blob ID -> location records for the blob index, if enabled
+        self.index = {} if index else None
+        self.derived = {}
+
+    def pinned(self):
+        # extraction and the index need the final blob IDs while chewing, so
+        # nothing can be chewed by workers or taken from a cache then
+        return bool(self.to_extract or self.extract_all
+                    or self.index is not None)
+
+    def spawn(self):
+        # same options, but blob IDs counted from 0 again
+        ctx = ChewContext(self.to_extract, self.extract_all, self.memo,
+                          self.index is not None, self.threads, self.stats,
+                          self.limits, self.spool, self.cache_pages)
+        ctx._pool = self._pool
+        return ctx
+
+    def pool(self):
+        if self.threads > 1 and self._pool is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._pool = ThreadPoolExecutor(self.threads)
+
+        return self._pool
+
+    def __getstate__(self):
+        # worker processes start their own pool, and their results are sent
+        # back pickled
+        state = self.__dict__.copy()
+        state["_pool"] = None
+        state["spool"] = False
+        return state
+
+
+# the context of the chew() call tree running in this thread, so that
+# modules can chew nested blobs without passing it around themselves
+_context = contextvars.ContextVar("context")
+
+
+class ChewMemo(object):
+    # LRU of results of small blobs keyed by their content so that blobs
+    # embedded over and over again (ICC profiles, XMP packets, duplicate
+    # archive members, ...) are only chewed once
+
+    max_size = 1 << 20
+    max_entries = 4096
+
+    def __init__(self, max_size=None, max_entries=None):
+        if max_size is not None:
+            self.max_size = max_size
+        if max_entries is not None:
+            self.max_entries = max_entries
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+
+        return entry
+
+    def put(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def take_counts(self):
+        # hands the hit and miss counts to the caller and starts over, used by
+        # worker processes to send theirs to the parent
+        with self._lock:
+            counts = self.hits, self.misses
+            self.hits = self.misses = 0
+
+        return counts
+
+    def merge_counts(self, counts):
+        with self._lock:
+            self.hits += counts[0]
+            self.misses += counts[1]
+
+    def report(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+    def __getstate__(self):
+        # worker processes start counting from scratch
+        state = self.__dict__.copy()
+        del state["_lock"]
+        state["hits"] = state["misses"] = 0
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+# arrays with at least this many items are spooled if the context allows it
+SPOOL_LENGTH = 1 << 12
+
+
+def spool_list(length):
+    # an empty list for the items of an array in the result, or a Spool that
+    # keeps them on disk if there are going to be length of them
+    ctx = _context.get(None)
+    if ctx is not None and ctx.spool and length >= SPOOL_LENGTH:
+        return Spool()
+
+    return []
+
+
+def derive(dst, src, start, codec):
+    # records that dst holds the data decoded with codec from src, from the
+    # raw position start up to where src is now, so that the blobs in dst
+    # can be located without parsing everything again
+    ctx = _context.get(None)
+    if ctx is None or ctx.index is None:
+        return
+
+    if src.chain is None:
+        ctx.derived[id(dst)] = None
+    else:
+        ctx.derived[id(dst)] = src.chain + [{
+            "offset": start,
+            "length": src.rawtell() - start,
+            "codec": codec
+        }]
+
+
+def blob_addresses(entry, address="0", addresses=None):
+    # maps blob IDs to path-like addresses made of the keys leading to the
+    # blob in the result, which don't depend on the order of traversal
+    if addresses is None:
+        addresses = {}
+
+    if isinstance(entry, dict):
+        if "blob-id" in entry:
+            addresses[entry["blob-id"]] = address
+
+        for k, v in entry.items():
+            # escaped like in JSON pointers
+            k = str(k).replace("~", "~0").replace("/", "~1")
+            blob_addresses(v, f"{address}/{k}", addresses)
+    elif isinstance(entry, list):
+        for i, v in enumerate(entry):
+            blob_addresses(v, f"{address}/{i}", addresses)
+
+    return addresses
+
+
+def shift_blob_ids(entry, delta):
+    if isinstance(entry, dict):
+        for k, v in entry.items():
+            if k == "blob-id":
+                entry[k] = v + delta
+            else:
+                shift_blob_ids(v, delta)
+    elif isinstance(entry, list):
+        for v in entry:
+            shift_blob_ids(v, delta)
 
 
 class EntryModule(module.RuminantModule):
 
-    def __init__(self, walk_mode, *args, **kwargs):
+    def __init__(self, walk_mode, ctx, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self.walk_mode = walk_mode
+        self.ctx = ctx
 
     def chew(self):
-        global blob_id
+        meta, parsed = self.chew_segment()
+
+        if not parsed or self.walk_mode or not self.buf.available():
+            return meta
+
+        # trailing data is chewed segment by segment in a loop rather than
+        # recursively so that e.g. a tar with many members doesn't need one
+        # stack frame per member
+        meta = {"type": "nested", "segments": [meta]}
+
+        while self.buf.available():
+            with self.buf.cut():
+                segment, parsed = self.chew_segment()
+                length = segment["length"]
+
+            meta["segments"].append(segment)
+
+            if not parsed or length == 0:
+                break
+
+            self.buf.skip(length)
+
+        self.buf.skip(self.buf.available())
+
+        return meta
+
+    def chew_segment(self):
+        ctx = self.ctx
 
         meta = {}
-        meta["blob-id"] = blob_id
-        my_blob_id = blob_id
-        blob_id += 1
+        meta["blob-id"] = ctx.blob_id
+        my_blob_id = ctx.blob_id
+        ctx.blob_id += 1
 
         offset = self.buf.tell()
+        start = self.buf.rawtell()
 
-        matched = False
-        for m in module.modules:
-            if m.identify(self.buf, {"walk": self.walk_mode}):
-                try:
-                    rest = m(self.buf).chew()
-                except Exception as e:
-                    if self.walk_mode:
-                        raise e
-
-                    self.buf.skip(self.buf.available())
-
-                    stack_list = []
-                    for frame in traceback.extract_tb(e.__traceback__):
-                        stack_list.append({
-                            "filename": frame.filename,
-                            "lineno": frame.lineno,
-                            "name": frame.name,
-                            "line": frame.line
-                        })
-
-                    rest = {
-                        "type": "error",
-                        "module": m.__name__,
-                        "error-type": type(e).__name__,
-                        "error-message": str(e),
-                        "stack": stack_list
-                    }
-
-                meta["length"] = self.buf.tell()
-                meta |= rest
-
-                matched = True
-
-                if self.buf.available() and not self.walk_mode:
-                    with self.buf.cut():
-                        meta = {"type": "nested", "segments": [meta]}
-
-                        trailer = self.chew()
-                        if trailer["type"] == "nested":
-                            meta["segments"] += trailer["segments"]
-                        else:
-                            meta["segments"].append(trailer)
-
-                    self.buf.skip(self.buf.available())
-                break
+        m = module.lookup(self.buf, {"walk": self.walk_mode})
+        if m is not None:
+            call = None
+            if ctx.stats is not None:
+                call = ctx.stats.enter(m.__name__)
+
+            depth = None
+            try:
+                if ctx.limits is not None:
+                    depth = budget.enter(ctx.limits)
+
+                rest = m(self.buf).chew()
+            except Exception as e:
+                if call is not None:
+                    call.failed = True
+
+                if self.walk_mode:
+                    raise e
 
-        if not matched:
+                self.buf.skip(self.buf.available())
+
+                import traceback
+
+                stack_list = []
+                for frame in traceback.extract_tb(e.__traceback__):
+                    stack_list.append({
+                        "filename": frame.filename,
+                        "lineno": frame.lineno,
+                        "name": frame.name,
+                        "line": frame.line
+                    })
+
+                rest = {
+                    "type": "error",
+                    "module": m.__name__,
+                    "error-type": type(e).__name__,
+                    "error-message": str(e),
+                    "stack": stack_list
+                }
+            finally:
+                if depth is not None:
+                    budget.leave(depth)
+
+                if call is not None:
+                    ctx.stats.leave(call)
+
+            meta["length"] = self.buf.tell()
+            meta |= rest
+        else:
             meta |= {"type": "unknown", "length": self.buf.size()}
 
-        if extract_all and my_blob_id > 0:
-            to_extract.append(
+        if ctx.index is not None:
+            ctx.index[my_blob_id] = {
+                "offset": start,
+                "length": meta["length"],
+                "chain": self.buf.chain
+            }
+
+        if ctx.extract_all and my_blob_id > 0:
+            ctx.to_extract.append(
                 (my_blob_id,
                  os.path.join("blobs", f"{str(my_blob_id).zfill(8)}.bin")))
 
-        for entry in to_extract[:]:
+        for entry in ctx.to_extract[:]:
             k, v = entry
 
             if k == my_blob_id:
-                to_extract.remove(entry)
+                ctx.to_extract.remove(entry)
 
                 with self.buf:
                     self.buf.resetunit()
                     self.buf.seek(offset)
 
                     with open(v, "wb") as file:
-                        length = meta["length"] if meta[
-                            "type"] != "nested" else meta["segments"][0][
-                                "length"]
+                        length = meta["length"]
 
                         while length:
-                            blob = self.buf.read(min(1 << 24, length))
+                            blob = self.buf.readview(min(1 << 24, length))
                             file.write(blob)
                             length -= len(blob)
 
                             if len(blob) == 0:
                                 break
 
+        return meta, m is not None
+
+
+def chew(blob, walk_mode=False, ctx=None):
+    # nested calls from modules inherit the context of the outer call, a
+    # top-level call without one gets a fresh context
+    outer = _context.get(None)
+    if ctx is None:
+        ctx = outer if outer is not None else ChewContext()
+
+    buf = Buf.of(blob, ctx.cache_pages)
+    if outer is None:
+        if buf.chain is None:
+            buf.chain = []
+    elif buf is not blob and ctx.index is not None:
+        buf.chain = ctx.derived.pop(id(blob), None)
+
+    token = _context.set(ctx)
+    try:
+        return _chew(buf, walk_mode, ctx)
+    finally:
+        _context.reset(token)
+
+        # the cache belongs to the buffer created here, nested calls share it
+        if buf is not blob and buf.cache is not None and ctx.stats is not None:
+            ctx.stats.count_pages(buf.cache)
+
+
+def _chew_job(ctx, job):
+    _context.set(ctx)
+    if ctx.stats is None:
+        return job(), ctx.blob_id
+
+    with ctx.stats.detached():
+        return job(), ctx.blob_id
+
+
+def chew_all(jobs):
+    # runs jobs, callables that each return the result of one chew() call, on
+    # the context's thread pool and returns their results in order, with the
+    # blob IDs they would have gotten when run one after another
+    jobs = list(jobs)
+
+    ctx = _context.get(None)
+    pool = None if ctx is None or ctx.pinned() else ctx.pool()
+    if pool is None or len(jobs) < 2:
+        return [job() for job in jobs]
+
+    def run(job, context):
+        # every job counts its blob IDs from 0 in a context of its own
+        return context.run(_chew_job, ctx.spawn(), job)
+
+    contexts = [contextvars.copy_context() for job in jobs]
+    futures = [pool.submit(run, *args) for args in zip(jobs, contexts)]
+
+    results = []
+    try:
+        for future, job, context in zip(futures, jobs, contexts):
+            # a thread waiting for a job that hasn't started yet runs it
+            # itself, so that jobs submitted from jobs can't starve the pool
+            if future.cancel():
+                meta, count = run(job, context)
+            else:
+                meta, count = future.result()
+
+            shift_blob_ids(meta, ctx.blob_id)
+            ctx.blob_id += count
+            results.append(meta)
+    except BaseException:
+        # e.g. a budget that ran out, the jobs that haven't started yet would
+        # only be thrown away
+        for future in futures:
+            future.cancel()
+
+        raise
+
+    return results
+
+
+class ChewQueue(object):
+    # collects the nested blobs of a module whose byte ranges are known up
+    # front and chews them with chew_all() when it's left; every blob gets a
+    # placeholder in its dict until then so that the keys keep their order,
+    # which means that the module mustn't chew anything else itself
+
+    max_size = 1 << 26
+
+    def __init__(self):
+        self.jobs = []
+        self.size = 0
+
+    def put(self, target, key, blob):
+        # blob is a Buf.fork() positioned at the blob or the blob itself
+        ctx = _context.get(None)
+        if ctx is None or ctx.pinned() or ctx.pool() is None:
+            target[key] = chew(blob)
+            return
+
+        target[key] = None
+        self.jobs.append((target, key, blob))
+
+        # decoded blobs are held in memory until they are chewed
+        if isinstance(blob, bytes):
+            self.size += len(blob)
+        else:
+            self.size += blob.available()
+        if self.size >= self.max_size:
+            self.run()
+
+    def run(self):
+        jobs, self.jobs, self.size = self.jobs, [], 0
+
+        results = chew_all(
+            functools.partial(chew, blob) for _, _, blob in jobs)
+        for (target, key, _), result in zip(jobs, results):
+            target[key] = result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # also if the module failed, so that the blob IDs are the same as if
+        # everything was chewed right away
+        self.run()
+
+
+def _chew(buf, walk_mode, ctx):
+    memo = ctx.memo
+
+    # reused results have no locations to put into the index, and with a
+    # depth limit they depend on where the blob was found
+    if (memo is None or walk_mode or ctx.extract_all or ctx.index is not None
+            or (ctx.limits is not None and ctx.limits.max_depth is not None)):
+        return EntryModule(walk_mode, ctx, buf).chew()
+
+    if buf.size() > memo.max_size:
+        return EntryModule(walk_mode, ctx, buf).chew()
+
+    import hashlib
+
+    # a module can seek back to the start of the buffer (e.g. for offsets
+    # that are counted from there), so the key covers all of it and not just
+    # what comes after tell()
+    with buf:
+        buf.seek(0)
+        data = buf.peek(buf.size())
+
+    key = (hashlib.sha256(data).digest(), buf.size(), buf.tell(), buf.unit)
+
+    entry = memo.get(key)
+    if entry is not None:
+        meta, count, offset, unit = entry
+
+        # blobs that are about to be extracted have to be chewed for real
+        if not any(ctx.blob_id <= k < ctx.blob_id + count
+                   for k, v in ctx.to_extract):
+            meta = copy.deepcopy(meta)
+            shift_blob_ids(meta, ctx.blob_id)
+            ctx.blob_id += count
+
+            buf.seek(offset)
+            buf.unit = unit
+            return meta
+
+    first = ctx.blob_id
+    meta = EntryModule(walk_mode, ctx, buf).chew()
+
+    # cut short by the budget of this file, which others may not run out of
+    if budget.exceeded():
         return meta
 
+    entry = copy.deepcopy(meta)
+    shift_blob_ids(entry, -first)
+    memo.put(key, (entry, ctx.blob_id - first, buf.tell(), buf.unit))
+
+    return meta
 
-def chew(blob, walk_mode=False):
-    return EntryModule(walk_mode, Buf.of(blob)).chew()
 
+# the format modules are only imported once a blob with one of their magics
+# shows up (or, for those with an identify(), once it has to be asked), the
+# order is the one they are tried in; the optional last entry is the SCAN of
+# the module
+SIGNATURES = [
+    ("containers", "ZipModule", [(0, b"\x50\x4b\x03\x04")]),
+    ("containers", "RIFFModule", [(0, b"RIFF"), (0, b"AT&T")]),
+    ("containers", "TarModule", [(257, b"ustar")]),
+    ("images", "IPTCIIMModule", [(0, b"Photoshop 3.0\x008BIM")]),
+    ("images", "ICCProfileModule", [(0, b"ICC_PROFILE\x00"), (4, b"Lino"),
+                                    (4, b"appl"), (36, b"acsp")]),
+    ("images", "JPEGModule", [(0, b"\xff\xd8\xff")]),
+    ("images", "PNGModule", [(0, b"\x89PNG\r\n\x1a\n")]),
+    ("images", "TIFFModule", [(0, b"II*\x00"), (0, b"MM\x00*"), (0, b"Exif"),
+                              (0, b"FUJIFILM")]),
+    ("images", "GifModule", [(0, b"GIF")]),
+    ("videos", "IsoModule", [(4, b"ftyp")]),
+    ("videos", "MatroskaModule", [(0, b"\x1a\x45\xdf\xa3")]),
+    ("videos", "OggModule", [(0, b"OggS")]),
+    ("documents", "DocxModule", []),
+    ("documents", "PdfModule", [(0, b"%PDF-")]),
+    ("fonts", "TrueTypeModule", [(0, b"\x00\x01\x00\x00\x00"),
+                                 (0, b"OTTO\x00")]),
+    ("audio", "FlacModule", [(0, b"fLaC")]),
+    ("audio", "ID3v2Module", [(0, b"ID3")]),
+    ("crypto", "DerModule", [
+        (0, bytes([0x30, i])) for i in (*range(0x30, 0x40), *range(0x80, 0x90))
+    ]),
+    ("crypto", "PemModule", [(0, b"-----BEGIN CERTIFICATE-----")]),
+    ("crypto", "PgpModule", [(0, b"-----BEGIN PGP ")], True, [(0, b"\x85"),
+                                                              (0, b"\x89")]),
+    ("compression", "GzipModule", [(0, b"\x1f\x8b")]),
+    ("compression", "Bzip2Module", [(0, b"BZ")]),
+]
 
-from . import containers, images, videos, documents, fonts, audio, crypto, compression  # noqa: F401,E402,E501
+for package, name, magic, *rest in SIGNATURES:
+    module.register_lazy(f"{__name__}.{package}", name, magic, *rest)
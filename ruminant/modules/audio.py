@@ -5,9 +5,7 @@ import zlib
 
 @module.register
 class FlacModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(4) == b"fLaC"
+    MAGIC = [(0, b"fLaC")]
 
     def chew(self):
         meta = {}
@@ -112,9 +110,7 @@ class FlacModule(module.RuminantModule):
 
 @module.register
 class ID3v2Module(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(3) == b"ID3"
+    MAGIC = [(0, b"ID3")]
 
     def read_length(self):
         length = 0
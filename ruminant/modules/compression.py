@@ -1,5 +1,5 @@
 from .. import module, utils
-from . import chew
+from . import chew, derive
 
 import datetime
 import tempfile
@@ -8,9 +8,7 @@ import zlib
 
 @module.register
 class GzipModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(2) == b"\x1f\x8b"
+    MAGIC = [(0, b"\x1f\x8b")]
 
     def chew(self):
         meta = {}
@@ -89,13 +87,15 @@ class GzipModule(module.RuminantModule):
 
         with tempfile.TemporaryFile() as fd:
             decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+            start = self.buf.rawtell()
 
             while not decompressor.eof:
-                fd.write(decompressor.decompress(self.buf.read(1 << 24)))
+                fd.write(decompressor.decompress(self.buf.readview(1 << 24)))
 
             self.buf.seek(-len(decompressor.unused_data), 1)
 
             fd.write(decompressor.flush())
+            derive(fd, self.buf, start, "deflate")
 
             fd.seek(0)
             meta["data"] = chew(fd)
@@ -108,9 +108,7 @@ class GzipModule(module.RuminantModule):
 
 @module.register
 class Bzip2Module(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(2) == b"BZ"
+    MAGIC = [(0, b"BZ")]
 
     def chew(self):
         meta = {}
@@ -123,7 +121,9 @@ class Bzip2Module(module.RuminantModule):
             length = self.buf.tell() - offset
 
         with tempfile.TemporaryFile() as fd:
+            start = self.buf.rawtell()
             utils.stream_bzip2(self.buf, fd, length)
+            derive(fd, self.buf, start, "bzip2")
 
             fd.seek(0)
             meta["data"] = chew(fd)
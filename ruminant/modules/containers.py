@@ -1,21 +1,52 @@
-from . import chew
+from . import ChewQueue, chew, chew_all, derive
 from .. import module, utils, constants
+from ..buf import Record
 
+import functools
 import tempfile
 import re
 
 
 @module.register
 class ZipModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(4) == b"\x50\x4b\x03\x04"
+    MAGIC = [(0, b"\x50\x4b\x03\x04")]
+
+    CENTRAL_DIRECTORY_ENTRY = Record(
+        "<4xHH2sHHH4sIIHHHH2s4sI", "version-producer", "version-needed",
+        "general-flags", "compression-method", "modification-time",
+        "modification-date", "crc32", "compressed-size", "uncompressed-size",
+        "filename-length", "extra-field-length", "comment-length",
+        "start-disk", "internal-attributes", "external-attributes", "offset")
+
+    def find_eocd(self):
+        # the EOCD record is usually the last thing in the archive, so only
+        # the tail (22 bytes plus a comment of at most 64 KiB) is searched
+        self.buf.seek(self.buf.size())
+        try:
+            self.buf.rsearch(b"\x50\x4b\x05\x06", 22 + 0xffff)
+
+            with self.buf:
+                self.buf.skip(12)
+                size = self.buf.ru32l()
+                offset = self.buf.ru32l()
+                comment_length = self.buf.ru16l()
+                eof = self.buf.tell() + comment_length
+
+            # but it has to belong to the archive starting here and not to
+            # one appended to it
+            if offset + size == self.buf.tell() and eof == self.buf.size():
+                return
+        except ValueError:
+            pass
+
+        self.buf.seek(0)
+        self.buf.search(b"\x50\x4b\x05\x06")
 
     def chew(self):
         meta = {}
         meta["type"] = "zip"
 
-        self.buf.search(b"\x50\x4b\x05\x06")
+        self.find_eocd()
 
         self.buf.skip(4)
         meta["eocd"] = {}
@@ -31,64 +62,93 @@ class ZipModule(module.RuminantModule):
         self.buf.seek(meta["eocd"]["central-directory-offset"])
 
         meta["files"] = []
+        jobs = []
         while self.buf.pu32() == 0x504b0102:
-            self.buf.skip(4)
+            entry = self.buf.rrecord(self.CENTRAL_DIRECTORY_ENTRY)
 
             file = {}
             file["meta"] = {}
-            file["meta"]["version-producer"] = self.buf.ru16l()
-            file["meta"]["version-needed"] = self.buf.ru16l()
-            file["meta"]["general-flags"] = self.buf.rh(2)
-            file["meta"]["compression-method"] = self.buf.ru16l()
-            file["meta"]["modification-time"] = self.buf.ru16l()
-            file["meta"]["modification-date"] = self.buf.ru16l()
-            file["meta"]["crc32"] = self.buf.rh(4)
-            file["meta"]["compressed-size"] = self.buf.ru32l()
-            file["uncompressed-size"] = self.buf.ru32l()
-            filename_length = self.buf.ru16l()
-            extra_field_length = self.buf.ru16l()
-            comment_length = self.buf.ru16l()
-            file["meta"]["start-disk"] = self.buf.ru16l()
-            file["meta"]["internal-attributes"] = self.buf.rh(2)
-            file["meta"]["external-attributes"] = self.buf.rh(4)
-            file["offset"] = self.buf.ru32l()
-            file["filename"] = self.buf.rs(filename_length)
-            file["meta"]["extra-field"] = self.buf.rs(extra_field_length,
-                                                      "latin-1")
-            file["meta"]["comment"] = self.buf.rs(comment_length)
-
+            for key in ("version-producer", "version-needed", "general-flags",
+                        "compression-method", "modification-time",
+                        "modification-date", "crc32", "compressed-size"):
+                file["meta"][key] = entry[key]
+            file["meta"]["general-flags"] = entry["general-flags"].hex()
+            file["meta"]["crc32"] = entry["crc32"].hex()
+            file["uncompressed-size"] = entry["uncompressed-size"]
+            file["meta"]["start-disk"] = entry["start-disk"]
+            file["meta"]["internal-attributes"] = entry[
+                "internal-attributes"].hex()
+            file["meta"]["external-attributes"] = entry[
+                "external-attributes"].hex()
+            file["offset"] = entry["offset"]
+            file["filename"] = self.buf.rs(entry["filename-length"])
+            file["meta"]["extra-field"] = self.buf.rs(
+                entry["extra-field-length"], "latin-1")
+            file["meta"]["comment"] = self.buf.rs(entry["comment-length"])
+
+            # members are independent of each other, so they can be
+            # inflated and chewed on the context's thread pool
             if file["uncompressed-size"] > 0:
-                with self.buf:
-                    self.buf.seek(file["offset"])
-                    assert self.buf.ru32() == 0x504b0304, "broken ZIP file"
-                    self.buf.skip(22)
-                    self.buf.skip(self.buf.ru16l() + self.buf.ru16l())
-
-                    match file["meta"]["compression-method"]:
-                        case 0:
-                            with self.buf.sub(file["uncompressed-size"]):
-                                file["data"] = chew(self.buf)
-
-                        case 8:
-                            with self.buf.sub(file["meta"]["compressed-size"]):
-                                fd = tempfile.TemporaryFile()
-                                utils.stream_deflate(self.buf, fd,
-                                                     self.buf.available())
-                                fd.seek(0)
-
-                                file["data"] = chew(fd)
+                jobs.append((file,
+                             functools.partial(self.chew_member,
+                                               self.buf.fork(), file)))
 
             meta["files"].append(file)
 
+        for (file, _), data in zip(jobs, chew_all(job for _, job in jobs)):
+            if data is not None:
+                file["data"] = data
+
         self.buf.seek(eof)
         return meta
 
+    def chew_member(self, buf, file):
+        buf.seek(file["offset"])
+        assert buf.ru32() == 0x504b0304, "broken ZIP file"
+        buf.skip(22)
+        buf.skip(buf.ru16l() + buf.ru16l())
+
+        match file["meta"]["compression-method"]:
+            case 0:
+                with buf.sub(file["uncompressed-size"]):
+                    return chew(buf)
+
+            case 8:
+                with buf.sub(file["meta"]["compressed-size"]):
+                    fd = tempfile.TemporaryFile()
+                    start = buf.rawtell()
+                    utils.stream_deflate(buf, fd, buf.available())
+                    derive(fd, buf, start, "deflate")
+                    fd.seek(0)
+
+                    return chew(fd)
+
 
 @module.register
 class RIFFModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(4) in (b"RIFF", b"AT&T")
+    MAGIC = [(0, b"RIFF"), (0, b"AT&T")]
+
+    AVI_HEADER = Record("<III4s6I16s", "microseconds-per-frame",
+                        "max-bytes-per-second", "padding-granularity", "flags",
+                        "frame-count", "initial-frames", "stream-count",
+                        "buffer-size", "width", "height", "reserved")
+
+    STREAM_HEADER = Record("<4s4s4sHH6IiI4H", "type", "handler", "flags",
+                           "priority", "language", "initial-frames", "scale",
+                           "rate", "start", "length", "buffer-size", "quality",
+                           "sample-size", "frame-left", "frame-top",
+                           "frame-right", "frame-bottom")
+
+    VIDEO_FORMAT = Record("<3I2H4s5I", "header-size", "width", "height",
+                          "plane-count", "bits-per-pixel",
+                          "compression-method", "image-size",
+                          "horizontal-resolution", "vertical-resolution",
+                          "used-color-count", "important-color-count")
+
+    # without the size of the codec data, which older files don't have
+    AUDIO_FORMAT = Record("<HHIIHH", "format", "channel-count", "sample-rate",
+                          "average-bytes-per-second", "block-alignment",
+                          "bits-per-sample")
 
     def chew(self):
         meta = {}
@@ -101,7 +161,11 @@ class RIFFModule(module.RuminantModule):
             self.le = True
 
         self.strh_type = None
-        meta["data"] = self.read_chunk()
+
+        # chunks are read one after another, but the blobs in them can be
+        # chewed on the context's thread pool
+        with ChewQueue() as self.blobs:
+            meta["data"] = self.read_chunk()
 
         return meta
 
@@ -187,19 +251,14 @@ class RIFFModule(module.RuminantModule):
                 chunk["data"]["bits-per-sample"] = self.buf.ru16l()
             case "ICCP":
                 with self.buf.subunit():
-                    chunk["data"]["color-profile"] = chew(self.buf)
+                    self.blobs.put(chunk["data"], "color-profile",
+                                   self.buf.fork())
             case "avih":
-                chunk["data"]["microseconds-per-frame"] = self.buf.ru32l()
-                chunk["data"]["max-bytes-per-second"] = self.buf.ru32l()
-                chunk["data"]["padding-granularity"] = self.buf.ru32l()
-                chunk["data"]["flags"] = self.buf.rh(4)
-                chunk["data"]["frame-count"] = self.buf.ru32l()
-                chunk["data"]["initial-frames"] = self.buf.ru32l()
-                chunk["data"]["stream-count"] = self.buf.ru32l()
-                chunk["data"]["buffer-size"] = self.buf.ru32l()
-                chunk["data"]["width"] = self.buf.ru32l()
-                chunk["data"]["height"] = self.buf.ru32l()
-                chunk["data"]["reserved"] = self.buf.rh(16)
+                header = self.buf.rrecord(self.AVI_HEADER)
+
+                chunk["data"].update(header)
+                chunk["data"]["flags"] = header["flags"].hex()
+                chunk["data"]["reserved"] = header["reserved"].hex()
 
                 chunk["data"]["derived"] = {}
                 chunk["data"]["derived"][
@@ -208,48 +267,32 @@ class RIFFModule(module.RuminantModule):
                     "data"]["frame-count"] * chunk["data"][
                         "microseconds-per-frame"] / 1000000
             case "strh":
-                self.strh_type = self.buf.rs(4)
+                header = self.buf.rrecord(self.STREAM_HEADER)
+                self.strh_type = utils.decode(header["type"])
+
+                chunk["data"].update(header)
                 chunk["data"]["type"] = self.strh_type
-                chunk["data"]["handler"] = self.buf.rs(4)
-                chunk["data"]["flags"] = self.buf.rh(4)
-                chunk["data"]["priority"] = self.buf.ru16l()
+                chunk["data"]["handler"] = utils.decode(header["handler"])
+                chunk["data"]["flags"] = header["flags"].hex()
 
-                language = self.buf.ru16l()
+                language = header["language"]
                 chunk["data"]["language"] = {
                     "raw": language,
                     "name": constants.MICROSOFT_LCIDS.get(language, "Unknown")
                 }
-
-                chunk["data"]["initial-frames"] = self.buf.ru32l()
-                chunk["data"]["scale"] = self.buf.ru32l()
-                chunk["data"]["rate"] = self.buf.ru32l()
-                chunk["data"]["start"] = self.buf.ru32l()
-                chunk["data"]["length"] = self.buf.ru32l()
-                chunk["data"]["buffer-size"] = self.buf.ru32l()
-                chunk["data"]["quality"] = self.buf.ri32l()
-                chunk["data"]["sample-size"] = self.buf.ru32l()
-                chunk["data"]["frame-left"] = self.buf.ru16l()
-                chunk["data"]["frame-top"] = self.buf.ru16l()
-                chunk["data"]["frame-right"] = self.buf.ru16l()
-                chunk["data"]["frame-bottom"] = self.buf.ru16l()
             case "strf":
                 match self.strh_type:
                     case "vids":
-                        chunk["data"]["header-size"] = self.buf.ru32l()
-                        chunk["data"]["width"] = self.buf.ru32l()
-                        chunk["data"]["height"] = self.buf.ru32l()
-                        chunk["data"]["plane-count"] = self.buf.ru16l()
-                        chunk["data"]["bits-per-pixel"] = self.buf.ru16l()
-                        chunk["data"]["compression-method"] = self.buf.rs(4)
-                        chunk["data"]["image-size"] = self.buf.ru32l()
-                        chunk["data"][
-                            "horizontal-resolution"] = self.buf.ru32l()
-                        chunk["data"]["vertical-resolution"] = self.buf.ru32l()
-                        chunk["data"]["used-color-count"] = self.buf.ru32l()
-                        chunk["data"][
-                            "important-color-count"] = self.buf.ru32l()
+                        header = self.buf.rrecord(self.VIDEO_FORMAT)
+
+                        chunk["data"].update(header)
+                        chunk["data"]["compression-method"] = utils.decode(
+                            header["compression-method"])
                     case "auds":
-                        format_tag = self.buf.ru16l()
+                        header = self.buf.rrecord(self.AUDIO_FORMAT)
+                        format_tag = header["format"]
+
+                        chunk["data"].update(header)
                         chunk["data"]["format"] = {
                             "raw": format_tag,
                             "name": {
@@ -263,13 +306,6 @@ class RIFFModule(module.RuminantModule):
                             }.get(format_tag, "Unknown")
                         }
 
-                        chunk["data"]["channel-count"] = self.buf.ru16l()
-                        chunk["data"]["sample-rate"] = self.buf.ru32l()
-                        chunk["data"][
-                            "average-bytes-per-second"] = self.buf.ru32l()
-                        chunk["data"]["block-alignment"] = self.buf.ru16l()
-                        chunk["data"]["bits-per-sample"] = self.buf.ru16l()
-
                         codec_data_size = self.buf.ru16l()
                         chunk["data"]["codec-data-size"] = codec_data_size
                     case _:
@@ -380,7 +416,7 @@ class RIFFModule(module.RuminantModule):
                 chunk["data"]["xml"] = utils.xml_to_dict(self.buf.readunit())
             case "ID3 ":
                 with self.buf.subunit():
-                    chunk["data"]["id3-tag"] = chew(self.buf)
+                    self.blobs.put(chunk["data"], "id3-tag", self.buf.fork())
             case "SNDM":
                 chunk["data"]["entries"] = []
 
@@ -398,10 +434,10 @@ class RIFFModule(module.RuminantModule):
                 chunk["data"]["non-zero"] = bool(sum(content))
 
                 if chunk["data"]["non-zero"]:
-                    chunk["data"]["data"] = chew(content)
+                    self.blobs.put(chunk["data"], "data", content)
             case "EXIF":
                 with self.buf.subunit():
-                    chunk["data"]["exif"] = chew(self.buf)
+                    self.blobs.put(chunk["data"], "exif", self.buf.fork())
             case "ICMT" | "ISFT" | "INAM" | "IART" | "ICRD":
                 chunk["data"]["comment"] = self.buf.readunit().decode(
                     "utf-8").rstrip("\x00")
@@ -424,7 +460,7 @@ class RIFFModule(module.RuminantModule):
                 chunk["data"]["unknown"] = True
 
                 with self.buf.subunit():
-                    chunk["data"]["blob"] = chew(self.buf)
+                    self.blobs.put(chunk["data"], "blob", self.buf.fork())
 
         self.buf.skipunit()
         self.buf.popunit()
@@ -434,26 +470,35 @@ class RIFFModule(module.RuminantModule):
 
 @module.register
 class TarModule(module.RuminantModule):
+    MAGIC = [(257, b"ustar")]
 
-    def identify(buf, ctx):
-        return buf.peek(262)[257:] == b"ustar"
+    HEADER = Record("100s8s8s8s12s12s8sB100s6x2s32s32s8s8s155s12x", "name",
+                    "mode", "owner-uid", "owner-gid", "size",
+                    "modification-date", "checksum", "file-type", "link-name",
+                    "ustar-version", "owner-user-name", "owner-group-name",
+                    "device-major", "device-minor", "prefix")
 
     def chew(self):
         meta = {}
         meta["type"] = "tar"
 
-        meta["name"] = self.buf.rs(100).rstrip(" ").rstrip("\x00")
-        meta["mode"] = self.buf.rs(8).rstrip(" ").rstrip("\x00")
-        meta["owner-uid"] = self.buf.rs(8).rstrip(" ").rstrip("\x00")
-        meta["owner-gid"] = self.buf.rs(8).rstrip(" ").rstrip("\x00")
+        header = self.buf.rrecord(self.HEADER)
+        for key, value in header.items():
+            if key != "file-type":
+                header[key] = utils.decode(value).rstrip(" ").rstrip("\x00")
+
+        meta["name"] = header["prefix"] + header["name"]
+        meta["mode"] = header["mode"]
+        meta["owner-uid"] = header["owner-uid"]
+        meta["owner-gid"] = header["owner-gid"]
 
-        file_length = self.buf.rs(12).rstrip(" ").rstrip("\x00")
+        file_length = header["size"]
         meta["size"] = file_length
 
-        meta["modification-date"] = self.buf.rs(12).rstrip(" ").rstrip("\x00")
-        meta["checksum"] = self.buf.rs(8).rstrip(" ").rstrip("\x00")
+        meta["modification-date"] = header["modification-date"]
+        meta["checksum"] = header["checksum"]
         meta["file-type"] = utils.unraw(
-            self.buf.ru8(), 1, {
+            header["file-type"], 1, {
                 0: "Normal file",
                 ord("0"): "Normal file",
                 ord("1"): "Hard link",
@@ -467,19 +512,12 @@ class TarModule(module.RuminantModule):
                 ord("x"): "Local pax header"
             })
 
-        meta["link-name"] = self.buf.rs(100).rstrip(" ").rstrip("\x00")
-
-        self.buf.skip(6)
-
-        meta["ustar-version"] = self.buf.rs(2).rstrip(" ").rstrip("\x00")
-        meta["owner-user-name"] = self.buf.rs(32).rstrip(" ").rstrip("\x00")
-        meta["owner-group-name"] = self.buf.rs(32).rstrip(" ").rstrip("\x00")
-        meta["device-major"] = self.buf.rs(8).rstrip(" ").rstrip("\x00")
-        meta["device-minor"] = self.buf.rs(8).rstrip(" ").rstrip("\x00")
-        meta["name"] = self.buf.rs(155).rstrip(" ").rstrip(
-            "\x00") + meta["name"]
-
-        self.buf.skip(12)
+        meta["link-name"] = header["link-name"]
+        meta["ustar-version"] = header["ustar-version"]
+        meta["owner-user-name"] = header["owner-user-name"]
+        meta["owner-group-name"] = header["owner-group-name"]
+        meta["device-major"] = header["device-major"]
+        meta["device-minor"] = header["device-minor"]
 
         file_length = int(file_length, 8)
 
@@ -4,9 +4,8 @@ import base64
 
 @module.register
 class DerModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.pu8() == 0x30 and (buf.pu16() & 0xf0) in (0x80, 0x30)
+    MAGIC = [(0, bytes([0x30, i]))
+             for i in (*range(0x30, 0x40), *range(0x80, 0x90))]
 
     def chew(self):
         meta = {}
@@ -19,9 +18,7 @@ class DerModule(module.RuminantModule):
 
 @module.register
 class PemModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(27) == b"-----BEGIN CERTIFICATE-----"
+    MAGIC = [(0, b"-----BEGIN CERTIFICATE-----")]
 
     def chew(self):
         meta = {}
@@ -47,13 +44,15 @@ class PemModule(module.RuminantModule):
 
 @module.register
 class PgpModule(module.RuminantModule):
+    MAGIC = [(0, b"-----BEGIN PGP ")]
 
-    def identify(buf, ctx):
-        with buf:
-            if buf.pu8() in (0x85, 0x89) and buf.peek(4)[3] in (0x03, 0x04):
-                return True
+    # the first byte of the binary packets identify() accepts
+    SCAN = [(0, b"\x85"), (0, b"\x89")]
 
-            return buf.rl().startswith(b"-----BEGIN PGP ")
+    def identify(buf, ctx):
+        head = buf.peek(4)
+        return len(head) == 4 and head[0] in (0x85, 0x89) and head[3] in (0x03,
+                                                                          0x04)
 
     def chew(self):
         meta = {}
@@ -1,20 +1,19 @@
 from .. import module, utils
-from . import chew
+from . import ChewQueue
 from ..buf import Buf
 
-import zipfile
-import xml.etree.ElementTree as ET
 import re
 import math
 
 
 @module.register
 class DocxModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return False  # TODO
+    # TODO: identify(), until then DOCX files are chewed as ZIP archives
 
     def chew(self):
+        import zipfile
+        import xml.etree.ElementTree as ET
+
         zf = zipfile.ZipFile(self.buf, "r")
         meta = {}
         meta["type"] = "docx"
@@ -120,6 +119,7 @@ class ReparsePoint(Exception):
 
 @module.register
 class PdfModule(module.RuminantModule):
+    MAGIC = [(0, b"%PDF-")]
     TOKEN_PATTERN = re.compile(
         r"( << | >> | \[ | \] | /[^\s<>/\[\]()]+ | \d+\s+\d+\s+R | \d+\.\d+ | \d+ | \( (?: [^\\\)] | \\ . )* \) | <[0-9A-Fa-f\s]*> | true | false | null )",  # noqa: E501
         re.VERBOSE | re.DOTALL,
@@ -127,9 +127,6 @@ class PdfModule(module.RuminantModule):
     INDIRECT_OBJECT_PATTERN = re.compile(r"^(\d+) (\d+) R$")
     XREF_PATTERN = re.compile(r"^(\d{10}) (\d{5}) ([nf]).*$")
 
-    def identify(buf, ctx):
-        return buf.peek(5) == b"%PDF-"
-
     def chew(self):
         meta = {}
         meta["type"] = "pdf"
@@ -137,9 +134,8 @@ class PdfModule(module.RuminantModule):
         meta["version"] = (self.buf.rl().decode("latin-1").split("-")[1])
         meta["binary-comment"] = self.buf.rl().hex()
 
-        self.buf.seek(0, 2)
-        while self.buf.peek(9) != b"startxref":
-            self.buf.seek(-1, 1)
+        self.buf.seek(self.buf.size())
+        self.buf.rsearch(b"startxref")
 
         self.buf.rl()
         xref_offset = int(self.buf.rl().decode("latin-1"))
@@ -153,83 +149,86 @@ class PdfModule(module.RuminantModule):
 
         ver_15_offsets = []
 
-        if self.buf.peek(4) == b"xref":
-            self.buf.rl()
+        # objects are parsed one after another, but the content of their
+        # streams can be chewed on the context's thread pool
+        with ChewQueue() as self.blobs:
+            if self.buf.peek(4) == b"xref":
+                self.buf.rl()
 
-            obj_id = 0
-            while True:
-                line = self.buf.rl().decode("latin-1")
+                obj_id = 0
+                while True:
+                    line = self.buf.rl().decode("latin-1")
 
-                if "trailer" in line:
-                    while self.buf.peek(7) != b"trailer":
-                        self.buf.seek(-1, 1)
+                    if "trailer" in line:
+                        self.buf.rsearch(b"trailer", len(line) + 2)
 
-                    self.buf.skip(7)
+                        self.buf.skip(7)
 
-                    d = self.read_value(self.buf)
+                        d = self.read_value(self.buf)
 
-                    if "XRefStm" in d:
-                        ver_15_offsets.append(d["XRefStm"])
+                        if "XRefStm" in d:
+                            ver_15_offsets.append(d["XRefStm"])
 
-                    if "Prev" in d:
-                        self.buf.seek(d["Prev"])
-                        self.buf.rl()
-                        continue
+                        if "Prev" in d:
+                            self.buf.seek(d["Prev"])
+                            self.buf.rl()
+                            continue
 
-                    break
+                        break
 
-                m = self.XREF_PATTERN.match(line)
-                if m:
-                    if m.group(3) == "n" and m.group(1) != "0000000000":
-                        self.queue.append((int(m.group(1)), self.buf))
+                    m = self.XREF_PATTERN.match(line)
+                    if m:
+                        if m.group(3) == "n" and m.group(1) != "0000000000":
+                            self.queue.append((int(m.group(1)), self.buf))
 
-                    obj_id += 1
-                else:
-                    obj_id = int(line.split(" ")[0])
-        else:
-            # version 1.5+
-            ver_15_offsets.append(self.buf.tell())
-
-        for offset in ver_15_offsets:
-            self.buf.seek(offset)
-            self.parse_object(self.buf)
-
-        while len(self.queue) + len(self.compressed):
-            stuck = True
-            if len(self.compressed):
-                for compressed_id, compressed_index, compressed_buf in self.compressed[:]:  # noqa: E501
-                    if compressed_id in self.objects:
+                        obj_id += 1
+                    else:
+                        obj_id = int(line.split(" ")[0])
+            else:
+                # version 1.5+
+                ver_15_offsets.append(self.buf.tell())
+
+            for offset in ver_15_offsets:
+                self.buf.seek(offset)
+                self.parse_object(self.buf)
+
+            while len(self.queue) + len(self.compressed):
+                stuck = True
+                if len(self.compressed):
+                    for compressed_id, compressed_index, compressed_buf in self.compressed[:]:  # noqa: E501
+                        if compressed_id in self.objects:
+                            try:
+                                with compressed_buf:
+                                    compressed_buf.seek(
+                                        self.objects[compressed_id][0]
+                                        ["offset"])
+                                    self.parse_object(compressed_buf,
+                                                      packed=(compressed_index,
+                                                              compressed_id))
+                                self.compressed.remove(
+                                    (compressed_id, compressed_index,
+                                     compressed_buf))
+                                stuck = False
+                            except ReparsePoint:
+                                pass
+
+                if len(self.queue):
+                    for i in range(0, len(self.queue)):
                         try:
-                            with compressed_buf:
-                                compressed_buf.seek(
-                                    self.objects[compressed_id][0]["offset"])
-                                self.parse_object(compressed_buf,
-                                                  packed=(compressed_index,
-                                                          compressed_id))
-                            self.compressed.remove(
-                                (compressed_id, compressed_index,
-                                 compressed_buf))
-                            stuck = False
-                        except ReparsePoint:
-                            pass
+                            offset, buf = self.queue[0]
 
-            if len(self.queue):
-                for i in range(0, len(self.queue)):
-                    try:
-                        offset, buf = self.queue[0]
+                            with buf:
+                                buf.seek(offset)
+                                self.parse_object(self.buf)
 
-                        with buf:
-                            buf.seek(offset)
-                            self.parse_object(self.buf)
-
-                        self.queue.pop(0)
-                        stuck = False
-                        break
-                    except ReparsePoint:
-                        self.queue.append(self.queue.pop(0))
+                            self.queue.pop(0)
+                            stuck = False
+                            break
+                        except ReparsePoint:
+                            self.queue.append(self.queue.pop(0))
 
-            if stuck:
-                break
+                if stuck:
+                    break
 
         for k in list(self.objects.keys()):
             if len(self.objects[k]) == 0:
@@ -304,7 +303,7 @@ class PdfModule(module.RuminantModule):
                     for filt in filters:
                         match filt:
                             case "/FlateDecode":
-                                content = buf.read()
+                                content = buf.readview()
 
                                 try:
                                     content = utils.zlib_decompress(content)
@@ -394,7 +393,7 @@ class PdfModule(module.RuminantModule):
                                     (self.resolve(obj["value"]["Prev"]),
                                      old_buf))
                         case _, _:
-                            obj["data"] = chew(buf)
+                            self.blobs.put(obj, "data", buf.fork())
 
                     buf = old_buf
 
@@ -1,12 +1,30 @@
 from .. import module, utils, constants
 from . import chew
+from ..buf import Record
 
 
 @module.register
 class TrueTypeModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(5) in (b"\x00\x01\x00\x00\x00", b"OTTO\x00")
+    MAGIC = [(0, b"\x00\x01\x00\x00\x00"), (0, b"OTTO\x00")]
+
+    # the part of the OS/2 table that every version has
+    OS2_HEADER = Record(">HhHHh11h10s16s4sHHH", "version", "x-avg-char-width",
+                        "us-weight-class", "us-width-class", "fs-type",
+                        "y-subscript-x-size", "y-subscript-y-size",
+                        "y-subscript-x-offset", "y-subscript-y-offset",
+                        "y-superscript-x-size", "y-superscript-y-size",
+                        "y-superscript-x-offset", "y-superscript-y-offset",
+                        "y-strikeout-size", "y-strikeout-position",
+                        "s-family-class", "panose", "ul-unicode-range",
+                        "ach-vend-id", "fs-selection", "fs-first-char-index",
+                        "fs-last-char-index")
+
+    HEAD = Record(">HHII4s2sH8s8s4hHHhhh", "major-version", "minor-version",
+                  "revision", "checksum-adjustment", "magic", "flags",
+                  "units-per-em", "created", "modified", "x-min", "y-min",
+                  "x-max", "y-max", "mac-style", "lowest-rec-ppem",
+                  "font-direction-hint", "index-to-loc-format",
+                  "glyph-data-format")
 
     def chew(self):
         meta = {}
@@ -36,30 +54,14 @@ class TrueTypeModule(module.RuminantModule):
                 table["data"] = {}
                 match table["tag"]:
                     case "OS/2":
-                        table["data"]["version"] = self.buf.ru16()
-                        table["data"]["x-avg-char-width"] = self.buf.ri16()
-                        table["data"]["us-weight-class"] = self.buf.ru16()
-                        table["data"]["us-width-class"] = self.buf.ru16()
-                        table["data"]["fs-type"] = self.buf.ri16()
-                        table["data"]["y-subscript-x-size"] = self.buf.ri16()
-                        table["data"]["y-subscript-y-size"] = self.buf.ri16()
-                        table["data"]["y-subscript-x-offset"] = self.buf.ri16()
-                        table["data"]["y-subscript-y-offset"] = self.buf.ri16()
-                        table["data"]["y-superscript-x-size"] = self.buf.ri16()
-                        table["data"]["y-superscript-y-size"] = self.buf.ri16()
-                        table["data"][
-                            "y-superscript-x-offset"] = self.buf.ri16()
-                        table["data"][
-                            "y-superscript-y-offset"] = self.buf.ri16()
-                        table["data"]["y-strikeout-size"] = self.buf.ri16()
-                        table["data"]["y-strikeout-position"] = self.buf.ri16()
-                        table["data"]["s-family-class"] = self.buf.ri16()
-                        table["data"]["panose"] = self.buf.rh(10)
-                        table["data"]["ul-unicode-range"] = self.buf.rh(16)
-                        table["data"]["ach-vend-id"] = self.buf.rs(4)
-                        table["data"]["fs-selection"] = self.buf.ru16()
-                        table["data"]["fs-first-char-index"] = self.buf.ru16()
-                        table["data"]["fs-last-char-index"] = self.buf.ru16()
+                        header = self.buf.rrecord(self.OS2_HEADER)
+
+                        table["data"].update(header)
+                        table["data"]["panose"] = header["panose"].hex()
+                        table["data"]["ul-unicode-range"] = header[
+                            "ul-unicode-range"].hex()
+                        table["data"]["ach-vend-id"] = utils.decode(
+                            header["ach-vend-id"])
 
                         if self.buf.unit >= 2:
                             table["data"]["s-typo-descender"] = self.buf.ri16()
@@ -122,25 +124,31 @@ class TrueTypeModule(module.RuminantModule):
                     case "fpgm" | "prep":
                         table["data"]["instruction-count"] = self.buf.unit
                     case "head":
+                        header = self.buf.rrecord(self.HEAD)
+
                         table["data"]["version"] = str(
-                            self.buf.ru16()) + "." + str(self.buf.ru16())
-                        table["data"]["revision"] = self.buf.ru32()
-                        table["data"]["checksum-adjustment"] = self.buf.ru32()
-                        table["data"]["magic"] = self.buf.rh(4)
-                        table["data"]["flags"] = self.buf.rh(2)
-                        table["data"]["units-per-em"] = self.buf.ru16()
-                        table["data"]["created"] = utils.mp4_time_to_iso(
-                            self.buf.ri64() if self.buf.pu32() ==
-                            0 else self.buf.ri64l())
-                        table["data"]["modified"] = utils.mp4_time_to_iso(
-                            self.buf.ri64() if self.buf.pu32() ==
-                            0 else self.buf.ri64l())
-                        table["data"]["x-min"] = self.buf.ri16()
-                        table["data"]["y-min"] = self.buf.ri16()
-                        table["data"]["x-max"] = self.buf.ri16()
-                        table["data"]["y-max"] = self.buf.ri16()
-
-                        mac_style = self.buf.ru16()
+                            header["major-version"]) + "." + str(
+                                header["minor-version"])
+                        table["data"]["revision"] = header["revision"]
+                        table["data"]["checksum-adjustment"] = header[
+                            "checksum-adjustment"]
+                        table["data"]["magic"] = header["magic"].hex()
+                        table["data"]["flags"] = header["flags"].hex()
+                        table["data"]["units-per-em"] = header["units-per-em"]
+
+                        for key in ("created", "modified"):
+                            # some fonts have their timestamps in little
+                            # endian
+                            order = "big" if header[key][:4] == bytes(
+                                4) else "little"
+                            table["data"][key] = utils.mp4_time_to_iso(
+                                int.from_bytes(header[key], order,
+                                               signed=True))
+
+                        for key in ("x-min", "y-min", "x-max", "y-max"):
+                            table["data"][key] = header[key]
+
+                        mac_style = header["mac-style"]
                         table["data"]["mac-style"] = {
                             "raw": mac_style,
                             "bold": bool(mac_style & 0x01),
@@ -152,10 +160,10 @@ class TrueTypeModule(module.RuminantModule):
                             "extended": bool(mac_style & 0x40)
                         }
 
-                        table["data"]["lowest-rec-ppem"] = self.buf.ru16()
-                        table["data"]["font-direction-hint"] = self.buf.ri16()
-                        table["data"]["index-to-loc-format"] = self.buf.ri16()
-                        table["data"]["glyph-data-format"] = self.buf.ri16()
+                        for key in ("lowest-rec-ppem", "font-direction-hint",
+                                    "index-to-loc-format",
+                                    "glyph-data-format"):
+                            table["data"][key] = header[key]
                     case "hhea":
                         table["data"]["version"] = str(
                             self.buf.ru16()) + "." + str(self.buf.ru16())
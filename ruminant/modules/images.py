@@ -1,11 +1,12 @@
 import zlib
 import datetime
-from . import chew
+from . import chew, spool_list
 from .. import module, utils
 
 
 @module.register
 class IPTCIIMModule(module.RuminantModule):
+    MAGIC = [(0, b"Photoshop 3.0\x008BIM")]
     RESOURCE_IDS = {
         1000: "Number of channels, rows, columns, depth, and mode (obsolete)",
         1001: "Macintosh print manager print info record",
@@ -223,9 +224,6 @@ class IPTCIIMModule(module.RuminantModule):
         }
     }
 
-    def identify(buf, ctx):
-        return buf.peek(18) == b"Photoshop 3.0\x008BIM"
-
     def chew(self):
         meta = {}
         meta["type"] = "iptc-iim"
@@ -367,6 +365,8 @@ class IPTCIIMModule(module.RuminantModule):
 
 @module.register
 class ICCProfileModule(module.RuminantModule):
+    MAGIC = [(0, b"ICC_PROFILE\x00"), (4, b"Lino"), (4, b"appl"),
+             (36, b"acsp")]
 
     def read_tag(self, offset, length):
         tag = {}
@@ -586,10 +586,6 @@ class ICCProfileModule(module.RuminantModule):
 
         return tag
 
-    def identify(buf, ctx):
-        return buf.peek(12) == b"ICC_PROFILE\x00" or buf.peek(8)[4:] in (
-            b"Lino", b"appl") or buf.peek(40)[36:] == b"acsp"
-
     def chew(self):
         meta = {}
         meta["type"] = "icc-profile"
@@ -661,6 +657,7 @@ class ICCProfileModule(module.RuminantModule):
 
 @module.register
 class JPEGModule(module.RuminantModule):
+    MAGIC = [(0, b"\xff\xd8\xff")]
     HAS_PAYLOAD = [
         0xc0,  # SOF0: Baseline DCT
         0xc1,  # SOF1: Extended sequential DCT
@@ -774,9 +771,6 @@ class JPEGModule(module.RuminantModule):
         0x01: "TEM",
     }
 
-    def identify(buf, ctx):
-        return buf.peek(3) == b"\xff\xd8\xff"
-
     def chew(self):
         meta = {}
         meta["type"] = "jpeg"
@@ -980,9 +974,7 @@ class JPEGModule(module.RuminantModule):
 
 @module.register
 class PNGModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(8) == b"\x89PNG\r\n\x1a\n"
+    MAGIC = [(0, b"\x89PNG\r\n\x1a\n")]
 
     def chew(self):
         meta = {}
@@ -1205,6 +1197,7 @@ class PNGModule(module.RuminantModule):
 
 @module.register
 class TIFFModule(module.RuminantModule):
+    MAGIC = [(0, b"II*\x00"), (0, b"MM\x00*"), (0, b"Exif"), (0, b"FUJIFILM")]
     TAG_IDS = {
         "tiff": {
             0: "GPSVersionID",
@@ -1522,10 +1515,6 @@ class TIFFModule(module.RuminantModule):
         12: "Double",
     }
 
-    def identify(buf, ctx):
-        return buf.peek(4) in (b"II*\x00", b"MM\x00*",
-                               b"Exif") or buf.peek(8) == b"FUJIFILM"
-
     def chew(self):
         meta = {}
         meta["type"] = "tiff"
@@ -1583,7 +1572,10 @@ class TIFFModule(module.RuminantModule):
                 tag_offset = self.buf.ru32l() if le else self.buf.ru32()
                 tag["offset-or-value"] = tag_offset
 
-                tag["values"] = []
+                # long arrays of numbers, like the strip offsets of a huge
+                # image, can be spooled
+                length = 0 if field_type in (2, 7) else count
+                tag["values"] = spool_list(length)
                 with self.buf:
                     if ((field_type in (1, 2, 7) and count <= 4)
                             or (field_type in (3, 8, 11) and count <= 2)
@@ -1693,9 +1685,7 @@ class TIFFModule(module.RuminantModule):
 
 @module.register
 class GifModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(3) == b"GIF"
+    MAGIC = [(0, b"GIF")]
 
     def chew(self):
         meta = {}
@@ -2,7 +2,7 @@ import uuid
 import struct
 import datetime
 from .. import module, utils, buf
-from . import chew
+from . import ChewQueue, spool_list
 
 
 def mp4_decode_language(lang_bytes):
@@ -17,20 +17,41 @@ def mp4_decode_language(lang_bytes):
 
 @module.register
 class IsoModule(module.RuminantModule):
+    MAGIC = [(4, b"ftyp")]
+
+    MOVIE_HEADER = {
+        version:
+        buf.Record(f">{times}IH10s36s24sI", "creation-time",
+                   "modification-time", "timescale", "duration", "rate",
+                   "volume", "reserved", "matrix", "pre-defined",
+                   "next-track-id")
+        for version, times in ((0, "IIII"), (1, "QQIQ"))
+    }
 
-    def identify(buf, ctx):
-        return buf.peek(8)[4:] == b"ftyp"
+    TRACK_HEADER = {
+        version:
+        buf.Record(f">{times}8sHHH2s36sII", "creation-time",
+                   "modification-time", "track-id", "reserved1", "duration",
+                   "reserved2", "layer", "alternate-group", "volume",
+                   "reserved3", "matrix", "width", "height")
+        for version, times in ((0, "III4sI"), (1, "QQI4sQ"))
+    }
 
     def chew(self):
         file = {}
 
         file["type"] = "iso"
         file["atoms"] = []
-        while not self.buf.isend():
-            file["atoms"].append(self.read_atom())
 
-        with self.buf:
-            self.parse_mdat(file["atoms"])
+        # atoms are read one after another, but the blobs in them (like ICC
+        # profiles or the content of mdat) can be chewed on the context's
+        # thread pool
+        with ChewQueue() as self.blobs:
+            while not self.buf.isend():
+                file["atoms"].append(self.read_atom())
+
+            with self.buf:
+                self.parse_mdat(file["atoms"])
 
         return file
 
@@ -96,31 +117,22 @@ class IsoModule(module.RuminantModule):
         elif typ == "mvhd":
             version = self.read_version(atom)
 
-            if version == 0:
-                creation_time = self.buf.ru32()
-                modification_time = self.buf.ru32()
-                timescale = self.buf.ru32()
-                duration = self.buf.ru32()
-            elif version == 1:
-                creation_time = self.buf.ru64()
-                modification_time = self.buf.ru64()
-                timescale = self.buf.ru32()
-                duration = self.buf.ru64()
+            if version in self.MOVIE_HEADER:
+                header = self.buf.rrecord(self.MOVIE_HEADER[version])
 
-            if version in (0, 1):
                 atom["data"]["creation-time"] = utils.mp4_time_to_iso(
-                    creation_time)
+                    header["creation-time"])
                 atom["data"]["modification-time"] = utils.mp4_time_to_iso(
-                    modification_time)
-                atom["data"]["timescale"] = timescale
-                atom["data"]["duration"] = duration
-
-                atom["data"]["rate"] = self.buf.rfp32()
-                atom["data"]["volume"] = self.buf.rfp16()
-                atom["data"]["reserved"] = self.buf.rh(10)
-                atom["data"]["matrix"] = self.buf.rh(36)
-                atom["data"]["pre-defined"] = self.buf.rh(24)
-                atom["data"]["next-track-id"] = self.buf.ru32()
+                    header["modification-time"])
+                atom["data"]["timescale"] = header["timescale"]
+                atom["data"]["duration"] = header["duration"]
+
+                atom["data"]["rate"] = header["rate"] / 65536
+                atom["data"]["volume"] = header["volume"] / 256
+                atom["data"]["reserved"] = header["reserved"].hex()
+                atom["data"]["matrix"] = header["matrix"].hex()
+                atom["data"]["pre-defined"] = header["pre-defined"].hex()
+                atom["data"]["next-track-id"] = header["next-track-id"]
         elif typ == "tkhd":
             version = self.buf.ru8()
             atom["data"]["version"] = version
@@ -132,37 +144,25 @@ class IsoModule(module.RuminantModule):
                 "preview": bool(flags & 4),
             }
 
-            if version == 0:
-                creation_time = self.buf.ru32()
-                modification_time = self.buf.ru32()
-                track_ID = self.buf.ru32()
-                reserved1 = self.buf.rh(4)
-                duration = self.buf.ru32()
-
-            if version == 1:
-                creation_time = self.buf.ru64()
-                modification_time = self.buf.ru64()
-                track_ID = self.buf.ru32()
-                reserved1 = self.buf.rh(4)
-                duration = self.buf.ru64()
+            if version in self.TRACK_HEADER:
+                header = self.buf.rrecord(self.TRACK_HEADER[version])
 
-            if version in (0, 1):
                 atom["data"]["creation-time"] = utils.mp4_time_to_iso(
-                    creation_time)
+                    header["creation-time"])
                 atom["data"]["modification-time"] = utils.mp4_time_to_iso(
-                    modification_time)
-                atom["data"]["track-id"] = track_ID
-                atom["data"]["reserved1"] = reserved1
-                atom["data"]["duration"] = duration
-
-                atom["data"]["reserved2"] = self.buf.rh(8)
-                atom["data"]["layer"] = self.buf.ru16()
-                atom["data"]["alternate-group"] = self.buf.ru16()
-                atom["data"]["volume"] = self.buf.rfp16()
-                atom["data"]["reserved3"] = self.buf.rh(2)
-                atom["data"]["matrix"] = self.buf.rh(36)
-                atom["data"]["width"] = self.buf.rfp32()
-                atom["data"]["height"] = self.buf.rfp32()
+                    header["modification-time"])
+                atom["data"]["track-id"] = header["track-id"]
+                atom["data"]["reserved1"] = header["reserved1"].hex()
+                atom["data"]["duration"] = header["duration"]
+
+                atom["data"]["reserved2"] = header["reserved2"].hex()
+                atom["data"]["layer"] = header["layer"]
+                atom["data"]["alternate-group"] = header["alternate-group"]
+                atom["data"]["volume"] = header["volume"] / 256
+                atom["data"]["reserved3"] = header["reserved3"].hex()
+                atom["data"]["matrix"] = header["matrix"].hex()
+                atom["data"]["width"] = header["width"] / 65536
+                atom["data"]["height"] = header["height"] / 65536
         elif typ == "edts":
             atom["data"] = self.read_atom()
         elif typ == "elst":
@@ -287,7 +287,8 @@ class IsoModule(module.RuminantModule):
                     atom["data"]["transfer-characteristics"] = self.buf.ru16()
                     atom["data"]["matrix-coefficients"] = self.buf.ru16()
                 case "rICC" | "prof":
-                    atom["data"]["icc_profile_data"] = chew(
+                    self.blobs.put(
+                        atom["data"], "icc_profile_data",
                         b"ICC_PROFILE\x00\x00\x00" + self.buf.readunit())
                 case "nclx":
                     atom["data"]["color-primaries"] = self.buf.ru16()
@@ -347,7 +348,7 @@ class IsoModule(module.RuminantModule):
             entry_count = self.buf.ru32()
             atom["data"]["entry-count"] = entry_count
 
-            atom["data"]["entries"] = []
+            atom["data"]["entries"] = spool_list(entry_count)
             for i in range(0, entry_count):
                 length = default_length
                 if length == 0:
@@ -361,7 +362,7 @@ class IsoModule(module.RuminantModule):
             entry_count = self.buf.ru32()
             atom["data"]["entry-count"] = entry_count
 
-            atom["data"]["entries"] = []
+            atom["data"]["entries"] = spool_list(entry_count)
             for i in range(0, entry_count):
                 atom["data"]["entries"].append({
                     "sample-count":
@@ -390,7 +391,8 @@ class IsoModule(module.RuminantModule):
                         "utf-8").rstrip("\x00")
                 else:
                     with self.buf.subunit():
-                        atom["data"]["content"] = chew(self.buf)
+                        self.blobs.put(atom["data"], "content",
+                                       self.buf.fork())
         elif typ == "co64":
             self.read_version(atom)
             entry_count = self.buf.ru32()
@@ -911,7 +913,7 @@ class IsoModule(module.RuminantModule):
             atom["data"]["name"] = self.buf.rzs()
         elif typ == "mpvd":
             with self.buf.subunit():
-                atom["data"]["content"] = chew(self.buf)
+                self.blobs.put(atom["data"], "content", self.buf.fork())
         elif typ == "meta":
             if self.buf.pu32() == 0:
                 self.buf.skip(4)
@@ -1055,10 +1057,11 @@ class IsoModule(module.RuminantModule):
                 atom["data"]["chapters"].append(chapter)
         elif typ == "dfLa":
             self.read_version(atom)
-            atom["data"]["content"] = chew(b"fLaC" + self.buf.readunit())
+            self.blobs.put(atom["data"], "content",
+                           b"fLaC" + self.buf.readunit())
         elif typ == "ID32":
             self.buf.skip(6)
-            atom["data"]["content"] = chew(self.buf.readunit())
+            self.blobs.put(atom["data"], "content", self.buf.readunit())
         elif typ == "nmhd":
             self.read_version(atom)
         elif typ in ("samr", "sawb", "mp4a", "drms", "alac", "owma", "ac-3",
@@ -1259,7 +1262,8 @@ class IsoModule(module.RuminantModule):
                             self.buf.skip(8)
 
                             with self.buf.subunit():
-                                atom["data"]["raw"] = chew(self.buf)
+                                self.blobs.put(atom["data"], "raw",
+                                               self.buf.fork())
 
                             self.buf.popunit()
         except Exception:
@@ -1269,6 +1273,7 @@ class IsoModule(module.RuminantModule):
 
 @module.register
 class MatroskaModule(module.RuminantModule):
+    MAGIC = [(0, b"\x1a\x45\xdf\xa3")]
     FIELDS = {
         0x1a45dfa3: ("EMBL", "master"),
         0x18538067: ("Segment", "master"),
@@ -1388,16 +1393,16 @@ class MatroskaModule(module.RuminantModule):
         0x447b: ("TagLanguageBCP47", "ascii")
     }
 
-    def identify(buf, ctx):
-        return buf.peek(4) == b"\x1a\x45\xdf\xa3"
-
     def chew(self):
         meta = {}
         meta["type"] = "matroska"
 
+        # tags are read one after another, but the blobs in them (like
+        # attached files) can be chewed on the context's thread pool
         meta["tags"] = []
-        while self.buf.available():
-            meta["tags"].append(self.read_tag())
+        with ChewQueue() as self.blobs:
+            while self.buf.available():
+                meta["tags"].append(self.read_tag())
 
         return meta
 
@@ -1475,7 +1480,7 @@ class MatroskaModule(module.RuminantModule):
                 tag["data"] = utils.to_uuid(self.buf.read(tag_length))
             case "blob":
                 with self.buf.sub(tag_length):
-                    tag["data"] = chew(self.buf)
+                    self.blobs.put(tag, "data", self.buf.fork())
 
                 self.buf.skip(tag_length)
             case "libmkv-workaround":
@@ -1512,9 +1517,7 @@ class MatroskaModule(module.RuminantModule):
 
 @module.register
 class OggModule(module.RuminantModule):
-
-    def identify(buf, ctx):
-        return buf.peek(4) == b"OggS"
+    MAGIC = [(0, b"OggS")]
 
     def chew(self):
         meta = {}
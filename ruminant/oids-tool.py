@@ -4,6 +4,8 @@ import os
 sys.path.insert(0, os.path.dirname(__file__))
 import oids  # noqa: E402
 
+tree = oids.read_tree()
+
 
 def append_unknowns(root, todo, base=[]):
     for key, value in root.items():
@@ -17,7 +19,7 @@ if len(sys.argv) > 1:
     todo = [[int(y) for y in x.split(".")] for x in sys.argv[1:]]
 else:
     todo = []
-    append_unknowns(oids.OIDS, todo)
+    append_unknowns(tree, todo)
 
 
 def insert(root, oid, name):
@@ -40,7 +42,7 @@ try:
         if len(name.strip()) == 0:
             continue
 
-        insert(oids.OIDS, oid, name)
+        insert(tree, oid, name)
 except EOFError:
     pass
 
@@ -53,6 +55,9 @@ def walk(root, file, base):
         walk(root["children"][key], file, base + [key])
 
 
-with open(os.path.join(os.path.dirname(__file__), "oids.txt"), "w") as file:
-    for key in sorted(oids.OIDS.keys()):
-        walk(oids.OIDS[key], file, [key])
+with open(oids.TEXT_PATH, "w") as file:
+    for key in sorted(tree.keys()):
+        walk(tree[key], file, [key])
+
+# the database that's loaded at runtime, keyed by the encoded OIDs
+oids.write_compiled()
@@ -1,20 +1,31 @@
+import hashlib
+import marshal
 import os
 
-OIDS = {}
+TEXT_PATH = os.path.join(os.path.dirname(__file__), "oids.txt")
+COMPILED_PATH = os.path.join(os.path.dirname(__file__), "oids.marshal")
 
-with open(os.path.join(os.path.dirname(__file__), "oids.txt"), "r") as file:
-    rows = []
-    for line in file.readlines():
-        if line.startswith("#"):
-            continue
 
-        line = line[:-1].split(": ")
-        rows.append((line[0], ": ".join(line[1:])))
+def read_rows():
+    with open(TEXT_PATH, "r") as file:
+        rows = []
+        for line in file.readlines():
+            if line.startswith("#"):
+                continue
 
-    for row in rows:
-        key = [int(x) for x in row[0].split(".")]
+            line = line[:-1].split(": ")
+            rows.append(
+                ([int(x) for x in line[0].split(".")], ": ".join(line[1:])))
 
-        root = OIDS
+    return rows
+
+
+def read_tree():
+    # nested arc -> {"name", "children"} dicts, edited by oids-tool.py
+    tree = {}
+
+    for key, name in read_rows():
+        root = tree
         for i in key[:-1]:
             if i not in root:
                 root[i] = {"name": "?", "children": {}}
@@ -24,4 +35,52 @@ with open(os.path.join(os.path.dirname(__file__), "oids.txt"), "r") as file:
         if key[-1] not in root:
             root[key[-1]] = {"name": "?", "children": {}}
 
-        root[key[-1]]["name"] = row[1]
+        root[key[-1]]["name"] = name
+
+    return tree
+
+
+def encode_arc(arc):
+    # base 128 with the high bit set on all but the last byte like in DER,
+    # but every arc on its own so that the first two can't collide
+    data = bytearray([arc & 0x7f])
+    arc >>= 7
+    while arc:
+        data.append(0x80 | (arc & 0x7f))
+        arc >>= 7
+
+    return bytes(reversed(data))
+
+
+def compile_names(rows):
+    # encoded arcs of every prefix -> name, a prefix that isn't in here is
+    # unknown
+    return {b"".join(encode_arc(i) for i in key): name for key, name in rows}
+
+
+def digest():
+    with open(TEXT_PATH, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+def write_compiled():
+    with open(COMPILED_PATH, "wb") as file:
+        marshal.dump((digest(), compile_names(read_rows())), file)
+
+
+def load():
+    # the compiled database is only used if it was made from this oids.txt,
+    # otherwise the text is parsed like before
+    try:
+        with open(COMPILED_PATH, "rb") as file:
+            stamp, names = marshal.load(file)
+
+        if stamp == digest():
+            return names
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    return compile_names(read_rows())
+
+
+NAMES = load()
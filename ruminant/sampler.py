@@ -0,0 +1,66 @@
+import collections
+import signal
+import sys
+import threading
+
+
+def fold(frame):
+    # one line per stack, outermost frame first, like flamegraph.pl expects
+    names = []
+    while frame is not None:
+        names.append(
+            f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}"  # noqa: E501
+        )
+        frame = frame.f_back
+
+    return ";".join(reversed(names))
+
+
+class StackSampler(object):
+    # samples the stacks of all threads hz times per second of CPU time and
+    # counts how often every distinct stack was seen
+
+    def __init__(self, hz):
+        self.hz = hz
+        self.samples = collections.Counter()
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, 1 / self.hz, 1 / self.hz)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def sample(self, sig, frame):
+        # the handler runs in the main thread, whose own stack is the
+        # interrupted frame and not the one of this handler
+        self.samples[fold(frame)] += 1
+
+        main = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident != main:
+                self.samples[fold(frame)] += 1
+
+    def merge(self, samples):
+        self.samples.update(samples)
+
+    def take(self):
+        # hands the samples to the caller and starts over, used by worker
+        # processes to send theirs to the parent
+        samples = self.samples
+        self.samples = collections.Counter()
+        return samples
+
+    def write(self, path):
+        with open(path, "w") as file:
+            for stack, count in sorted(self.samples.items()):
+                file.write(f"{stack} {count}\n")
+
+    def __getstate__(self):
+        # worker processes sample themselves, from scratch
+        return {"hz": self.hz}
+
+    def __setstate__(self, state):
+        self.__init__(state["hz"])
+        self.start()
@@ -0,0 +1,181 @@
+from . import budget, main
+from .workers import WorkerPool
+import copy
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+
+def response_line(request, data):
+    line = {"id": request.get("id")}
+    if "path" in request:
+        line["path"] = request["path"]
+
+    line["data"] = data
+    return json.dumps(line, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def answer(request, blob):
+    # every request has blob IDs counted from 0 and, with a timeout of its
+    # own, the budgets of the server with that timeout
+    ctx = main.worker_ctx.spawn()
+    if request["timeout"] is not None:
+        ctx.limits = copy.copy(ctx.limits) or budget.Limits()
+        ctx.limits.timeout = request["timeout"]
+
+    walk = bool(request.get("walk", False))
+
+    try:
+        if blob is None:
+            with open(request["path"], "rb") as file:
+                data = main.ruminate(ctx, file, walk)
+        else:
+            # chewed in place, without a copy or a BytesIO around it
+            data = main.ruminate(ctx, blob, walk)
+    except Exception as e:
+        data = budget.error_entry(e)
+
+    return response_line(request, data)
+
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    # one JSON request per line, a request with a length is followed by that
+    # many bytes to parse instead of a file; results are written as soon as
+    # they are done, one line each with the id of their request
+
+    def handle(self):
+        self.lock = threading.Lock()
+
+        threads = []
+        count = 0
+        while True:
+            line = self.rfile.readline()
+            if len(line) == 0:
+                break
+
+            if len(line.strip()) == 0:
+                continue
+
+            try:
+                request, blob = self.read_request(line, count)
+            except Exception as e:
+                # nothing after a broken request can be trusted to be the
+                # start of the next one
+                self.write(response_line({"id": count}, budget.error_entry(e)))
+                break
+
+            self.server.slots.acquire()
+            thread = threading.Thread(target=self.answer, args=(request, blob))
+            thread.start()
+
+            threads = [thread for thread in threads if thread.is_alive()]
+            threads.append(thread)
+            count += 1
+
+        for thread in threads:
+            thread.join()
+
+    def read_request(self, line, count):
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("a request has to be an object")
+
+        request.setdefault("id", count)
+
+        timeout = request.get("timeout", self.server.limits.timeout)
+        if timeout is not None and (not isinstance(timeout, (int, float))
+                                    or timeout <= 0):
+            raise ValueError(f"invalid timeout {timeout!r}")
+
+        request["timeout"] = timeout
+
+        if "length" in request:
+            length = request["length"]
+            if not isinstance(length, int) or length < 0:
+                raise ValueError(f"invalid length {length!r}")
+
+            blob = self.rfile.read(length)
+            if len(blob) < length:
+                raise EOFError(f"expected {length} bytes, got {len(blob)}")
+
+            return request, blob
+
+        if not isinstance(request.get("path"), str):
+            raise ValueError("a request needs a path or a length")
+
+        return request, None
+
+    def answer(self, request, blob):
+        try:
+            try:
+                line = self.server.pool.run(answer,
+                                            request,
+                                            blob,
+                                            timeout=budget.kill_timeout(
+                                                request["timeout"]))
+            except Exception as e:
+                # killed for running out of time or gone for another reason
+                line = response_line(request, budget.error_entry(e))
+
+            self.write(line)
+        finally:
+            self.server.slots.release()
+
+    def write(self, line):
+        with self.lock:
+            try:
+                self.wfile.write(line.encode("utf-8"))
+            except OSError:
+                # the client is gone, the other results are dropped too
+                pass
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, pool, jobs, limits):
+        super().__init__(path, RequestHandler)
+
+        self.pool = pool
+        self.limits = limits
+
+        # stops reading requests while all workers are busy, so that a client
+        # sending thousands of them doesn't get a thread for each
+        self.slots = threading.BoundedSemaphore(jobs)
+
+
+def remove_stale_socket(path):
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and isn't a socket")
+
+    with socket.socket(socket.AF_UNIX) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            # left behind by a server that didn't shut down cleanly
+            os.unlink(path)
+            return
+
+    raise FileExistsError(f"another server is listening on {path}")
+
+
+def serve(path, ctx, jobs):
+    remove_stale_socket(path)
+
+    pool = WorkerPool(jobs, main.init_worker, (ctx, ))
+    try:
+        with Server(path, pool, jobs, ctx.limits or budget.Limits()) as server:
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(path)
+    finally:
+        pool.close()
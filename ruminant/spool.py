@@ -0,0 +1,91 @@
+import marshal
+import tempfile
+
+
+class Spool(object):
+    # the items of a huge array in the result, pushed one at a time and kept
+    # in a temporary file instead of memory until write_json() streams them
+    # back; only for plain values, nothing in here is looked at for blob IDs
+
+    chunk_length = 1 << 12
+
+    def __init__(self):
+        self.file = tempfile.TemporaryFile()
+        self.chunk = []
+        self.length = 0
+
+        # where each chunk starts in the file
+        self.offsets = []
+
+    def append(self, item):
+        self.chunk.append(item)
+        self.length += 1
+
+        if len(self.chunk) >= self.chunk_length:
+            self.offsets.append(self.file.tell())
+            marshal.dump(self.chunk, self.file)
+            self.chunk = []
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        # single items only, for parsers that look at e.g. the first value
+        # of an array they put into the result
+        if index < 0:
+            index += self.length
+
+        if not 0 <= index < self.length:
+            raise IndexError("spool index out of range")
+
+        chunk, index = divmod(index, self.chunk_length)
+        if chunk == len(self.offsets):
+            return self.chunk[index]
+
+        self.file.seek(self.offsets[chunk])
+        try:
+            return marshal.load(self.file)[index]
+        finally:
+            self.file.seek(0, 2)
+
+    def __iter__(self):
+        self.file.seek(0)
+        try:
+            for i in range(self.length // self.chunk_length):
+                yield from marshal.load(self.file)
+        finally:
+            # append() writes at the current position
+            self.file.seek(0, 2)
+
+        yield from list(self.chunk)
+
+    def __deepcopy__(self, memo):
+        spool = Spool()
+        for item in self:
+            spool.append(item)
+
+        return spool
+
+
+class Items(list):
+    # what JSONEncoder sees instead of a Spool, its pure Python encoder only
+    # takes lists and iterates over them without indexing
+
+    def __init__(self, spool):
+        self.spool = spool
+
+    def __len__(self):
+        return len(self.spool)
+
+    def __iter__(self):
+        return iter(self.spool)
+
+
+def default(o):
+    # for JSONEncoder(default=...), which is only asked about types it doesn't
+    # know
+    if isinstance(o, Spool):
+        return Items(o)
+
+    raise TypeError(
+        f"Object of type {type(o).__name__} is not JSON serializable")
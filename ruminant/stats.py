@@ -0,0 +1,203 @@
+from .buf import Buf
+
+import contextlib
+import contextvars
+import threading
+import time
+
+# the module call whose chew() is running, nested calls point to their parent
+_frame = contextvars.ContextVar("frame", default=None)
+
+_instrumented = False
+
+
+def instrument():
+    # swaps counting versions of the Buf accessors in, so that nothing is paid
+    # for the counters unless stats are enabled
+    global _instrumented
+
+    if _instrumented:
+        return
+
+    _instrumented = True
+
+    read, readview, peek, seek = Buf.read, Buf.readview, Buf.peek, Buf.seek
+
+    def counted_read(self, count=None):
+        data = read(self, count)
+
+        frame = _frame.get()
+        if frame is not None:
+            frame.reads += 1
+            frame.bytes_read += len(data)
+
+        return data
+
+    def counted_readview(self, count=None):
+        # buffers without a view fall back to read(), which counts itself
+        if self._view is None:
+            return readview(self, count)
+
+        data = readview(self, count)
+
+        frame = _frame.get()
+        if frame is not None:
+            frame.reads += 1
+            frame.bytes_read += len(data)
+
+        return data
+
+    def counted_peek(self, length):
+        frame = _frame.get()
+        if frame is not None:
+            frame.peeks += 1
+
+        return peek(self, length)
+
+    def counted_seek(self, pos, whence=0):
+        frame = _frame.get()
+        if frame is not None:
+            frame.seeks += 1
+
+        return seek(self, pos, whence)
+
+    Buf.read = counted_read
+    Buf.readview = counted_readview
+    Buf.peek = counted_peek
+    Buf.seek = counted_seek
+
+
+class Frame(object):
+    __slots__ = ("name", "depth", "failed", "reads", "bytes_read", "peeks",
+                 "seeks", "wall", "cpu", "token")
+
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.failed = False
+        self.reads = 0
+        self.bytes_read = 0
+        self.peeks = 0
+        self.seeks = 0
+
+
+class ModuleStats(object):
+    # call counts, times and buffer accesses per module class and nesting
+    # depth; times include nested blobs, buffer accesses only count for the
+    # innermost module
+
+    FIELDS = ("calls", "failures", "wall-time", "cpu-time", "bytes-read",
+              "reads", "peeks", "seeks")
+
+    def __init__(self):
+        instrument()
+
+        # (module, depth) -> values in the order of FIELDS
+        self.entries = {}
+
+        # page cache hits and misses of the inputs that can't be mapped
+        self.pages = [0, 0]
+
+        self._lock = threading.Lock()
+
+    def enter(self, name):
+        parent = _frame.get()
+
+        frame = Frame(name, 0 if parent is None else parent.depth + 1)
+        frame.token = _frame.set(frame)
+        frame.wall = time.perf_counter()
+        frame.cpu = time.thread_time()
+
+        return frame
+
+    def leave(self, frame):
+        # cpu time is the one of the thread chewing the blob, nested blobs
+        # chewed on other threads aren't part of it
+        wall = time.perf_counter() - frame.wall
+        cpu = time.thread_time() - frame.cpu
+        _frame.reset(frame.token)
+
+        self.add((frame.name, frame.depth),
+                 (1, int(frame.failed), wall, cpu, frame.bytes_read,
+                  frame.reads, frame.peeks, frame.seeks))
+
+    @contextlib.contextmanager
+    def detached(self):
+        # for chew_all() jobs, which run on other threads while the module
+        # that started them waits; what they read outside of nested modules
+        # still counts for that module, but goes straight into the totals
+        # instead of into its frame, which only its own thread may touch
+        parent = _frame.get()
+        if parent is None:
+            yield
+            return
+
+        frame = Frame(parent.name, parent.depth)
+        token = _frame.set(frame)
+        try:
+            yield
+        finally:
+            _frame.reset(token)
+
+            self.add((frame.name, frame.depth),
+                     (0, 0, 0, 0, frame.bytes_read, frame.reads, frame.peeks,
+                      frame.seeks))
+
+    def add(self, key, values):
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.entries[key] = list(values)
+            else:
+                for i, value in enumerate(values):
+                    entry[i] += value
+
+    def count_pages(self, cache):
+        with self._lock:
+            self.pages[0] += cache.hits
+            self.pages[1] += cache.misses
+
+    def merge(self, counters):
+        entries, pages = counters
+        for key, values in entries.items():
+            self.add(key, values)
+
+        with self._lock:
+            self.pages[0] += pages[0]
+            self.pages[1] += pages[1]
+
+    def take(self):
+        # hands the counters to the caller and starts over, used by worker
+        # processes to send theirs to the parent
+        with self._lock:
+            counters = self.entries, self.pages
+            self.entries = {}
+            self.pages = [0, 0]
+
+        return counters
+
+    def report(self):
+        report = []
+        for (name, depth), values in self.entries.items():
+            entry = {"module": name, "depth": depth}
+            entry |= dict(zip(self.FIELDS, values))
+            entry["wall-time"] = round(entry["wall-time"], 6)
+            entry["cpu-time"] = round(entry["cpu-time"], 6)
+            report.append(entry)
+
+        report.sort(key=lambda entry: (-entry["wall-time"], entry["depth"]))
+        return {
+            "type": "stats",
+            "modules": report,
+            "page-cache": {
+                "hits": self.pages[0],
+                "misses": self.pages[1]
+            }
+        }
+
+    def __getstate__(self):
+        # worker processes start counting from scratch
+        return {}
+
+    def __setstate__(self, state):
+        self.__init__()
@@ -1,8 +1,4 @@
-from .oids import OIDS
-from .constants import PGP_HASHES, PGP_PUBLIC_KEYS, PGP_CIPHERS, PGP_AEADS, PGP_SIGNATURE_TYPES  # noqa: E501
-import uuid
-import xml.etree.ElementTree as ET
-from datetime import datetime, timezone, timedelta, UTC
+import functools
 import zlib
 import bz2
 
@@ -27,6 +23,8 @@ def _xml_to_dict(elem):
 
 
 def xml_to_dict(string):
+    import xml.etree.ElementTree as ET
+
     while len(string):
         try:
             return _xml_to_dict(ET.fromstring(string))
@@ -80,6 +78,8 @@ def read_protobuf(buf, length):
 
 
 def to_uuid(blob):
+    import uuid
+
     try:
         return str(uuid.UUID(bytes=blob))
     except ValueError:
@@ -87,6 +87,8 @@ def to_uuid(blob):
 
 
 def mp4_time_to_iso(mp4_time):
+    from datetime import datetime, timezone, timedelta
+
     mp4_epoch = datetime(1904, 1, 1, tzinfo=timezone.utc)
     dt = mp4_epoch + timedelta(seconds=mp4_time)
     return dt.isoformat()
@@ -97,7 +99,7 @@ def stream_deflate(src, dst, compressed_size, chunk_size=1 << 24):
     decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
 
     while remaining > 0:
-        chunk = src.read(min(chunk_size, remaining))
+        chunk = src.readview(min(chunk_size, remaining))
         dst.write(decompressor.decompress(chunk))
         remaining -= len(chunk)
 
@@ -111,7 +113,7 @@ def stream_bzip2(src, dst, compressed_size, chunk_size=1 << 24):
     decompressor = bz2.BZ2Decompressor()
 
     while remaining > 0:
-        chunk = src.read(min(chunk_size, remaining))
+        chunk = src.readview(min(chunk_size, remaining))
         dst.write(decompressor.decompress(chunk))
         remaining -= len(chunk)
 
@@ -119,6 +121,23 @@ def stream_bzip2(src, dst, compressed_size, chunk_size=1 << 24):
 
 
 def read_oid(buf, limit=-1):
+    # the encoding is peeked as a whole, so that repeated OIDs skip both the
+    # decoding and the lookup
+    if buf.unit is None or buf.unit < 1:
+        return lookup_oid(decode_oid(buf, limit))
+
+    length = buf.unit if limit < 0 else min(limit, buf.unit - 1) + 1
+    encoded = buf.peek(length)
+    if len(encoded) < length:
+        return lookup_oid(decode_oid(buf, limit))
+
+    buf.skip(length)
+
+    data = lookup_encoded_oid(encoded)
+    return data | {"tree": list(data["tree"])}
+
+
+def decode_oid(buf, limit=-1):
     oid = []
     c = buf.ru8()
     oid.append(c // 40)
@@ -136,10 +155,30 @@ def read_oid(buf, limit=-1):
 
         limit -= 1
 
+    return oid
+
+
+@functools.lru_cache(maxsize=4096)
+def lookup_encoded_oid(encoded):
+    # same as decode_oid() on the bytes it would consume, shared between all
+    # callers, so the result must not be modified
+    oid = [encoded[0] // 40, encoded[0] % 40]
+
+    i = 0
+    for c in encoded[1:]:
+        i <<= 7
+        i |= c & 0x7f
+
+        if not c & 0x80:
+            oid.append(i)
+            i = 0
+
     return lookup_oid(oid)
 
 
 def read_der(buf):
+    from datetime import datetime
+
     data = {}
 
     tag = buf.ru8()
@@ -297,15 +336,14 @@ def lookup_oid(oid):
     data = {}
     data["raw"] = ".".join([str(x) for x in oid])
 
+    # the OID database takes a while to load, so only when it's needed
+    from .oids import NAMES, encode_arc
+
     tree = []
-    root = OIDS
+    key = b""
     for i in oid:
-        if i in root:
-            tree.append(root[i]["name"])
-            root = root[i]["children"]
-        else:
-            tree.append("?")
-            root = {}
+        key += encode_arc(i)
+        tree.append(NAMES.get(key, "?"))
 
     data["tree"] = tree
     if tree[-1] != "?":
@@ -352,6 +390,9 @@ def read_pgp_mpi(buf):
 
 
 def read_pgp_subpacket(buf):
+    from .constants import PGP_HASHES, PGP_CIPHERS, PGP_AEADS
+    from datetime import datetime, UTC
+
     packet = {}
 
     length = buf.ru8()
@@ -512,6 +553,9 @@ def read_pgp_subpacket(buf):
 
 
 def _read_pgp(buf, fake=None):
+    from .constants import PGP_HASHES, PGP_PUBLIC_KEYS, PGP_CIPHERS, PGP_SIGNATURE_TYPES  # noqa: E501
+    from datetime import datetime, UTC
+
     packet = {}
 
     if fake is None:
@@ -0,0 +1,138 @@
+from . import module
+from .budget import BudgetExceeded
+import concurrent.futures
+import multiprocessing
+import queue
+import signal
+
+
+class WorkerExited(Exception):
+    pass
+
+
+def worker_main(conn, initializer, initargs):
+    # Ctrl-C reaches the whole process group, the parent shuts the workers
+    # down on its own
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if initializer is not None:
+        initializer(*initargs)
+
+    while True:
+        try:
+            fn, args = conn.recv()
+        except EOFError:
+            break
+
+        try:
+            reply = (True, fn(*args))
+        except Exception as e:
+            reply = (False, e)
+
+        conn.send(reply)
+
+
+def preload():
+    # the fork server imports these once, so that every worker forked from
+    # it starts with all format modules and the OID database loaded
+    packages = {"ruminant.main", "ruminant.oids", "ruminant.server"}
+    for cls in module.modules:
+        if isinstance(cls, module.LazyModule):
+            packages.add(cls.package)
+        else:
+            packages.add(cls.__module__)
+
+    return sorted(packages)
+
+
+class Worker(object):
+
+    def __init__(self, mp, initializer, initargs):
+        self.conn, child = mp.Pipe()
+        self.process = mp.Process(target=worker_main,
+                                  args=(child, initializer, initargs),
+                                  daemon=True)
+        self.process.start()
+        child.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WorkerPool(object):
+    # worker processes that are started once and then take one task after
+    # another like with ProcessPoolExecutor, but a worker whose task takes
+    # longer than the timeout is killed and replaced
+
+    def __init__(self, size, initializer=None, initargs=(), timeout=None):
+        self.initializer = initializer
+        self.initargs = initargs
+        self.timeout = timeout
+
+        # forking a threaded process isn't safe, workers that replace killed
+        # ones come from the fork server instead
+        self.mp = multiprocessing.get_context("forkserver")
+        self.mp.set_forkserver_preload(preload())
+
+        self.idle = queue.Queue()
+        for i in range(size):
+            self.idle.put(self.start_worker())
+
+        # submit() waits for the workers on threads of its own
+        self._threads = concurrent.futures.ThreadPoolExecutor(size)
+
+    def start_worker(self):
+        return Worker(self.mp, self.initializer, self.initargs)
+
+    def run(self, fn, *args, timeout=None):
+        worker = self.idle.get()
+        try:
+            error = None
+            try:
+                worker.conn.send((fn, args))
+                if worker.conn.poll(timeout):
+                    ok, result = worker.conn.recv()
+                else:
+                    error = BudgetExceeded(
+                        f"no result after {timeout} seconds")
+            except (EOFError, OSError):
+                error = WorkerExited(
+                    "the worker exited before returning a result")
+
+            if error is not None:
+                worker.kill()
+                worker = self.start_worker()
+                raise error
+
+            if not ok:
+                raise result
+
+            return result
+        finally:
+            self.idle.put(worker)
+
+    def submit(self, fn, *args):
+        return self._threads.submit(self.run, fn, *args, timeout=self.timeout)
+
+    def close(self):
+        self._threads.shutdown()
+
+        while True:
+            try:
+                worker = self.idle.get_nowait()
+            except queue.Empty:
+                break
+
+            # the worker exits on its own once its pipe is closed
+            worker.conn.close()
+            worker.process.join(1)
+            if worker.process.is_alive():
+                worker.kill()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,105 @@
+from ruminant import modules
+
+import concurrent.futures
+import gzip
+import io
+import struct
+import tarfile
+import wave
+import zipfile
+import zlib
+
+import pytest
+
+
+def png(width, height):
+
+    def chunk(typ, data):
+        return (struct.pack(">I", len(data)) + typ + data +
+                struct.pack(">I", zlib.crc32(typ + data)))
+
+    rows = b"".join(b"\x00" + bytes(range(width)) for i in range(height))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(
+        b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0)) +
+            chunk(b"tEXt", b"Comment\x00ruminant") +
+            chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+
+def wav():
+    file = io.BytesIO()
+    with wave.open(file, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(8000)
+        out.writeframes(b"\x00\x01" * 800)
+
+    return file.getvalue()
+
+
+def mp4():
+
+    def box(typ, data):
+        return struct.pack(">I", 8 + len(data)) + typ + data
+
+    return (box(b"ftyp", b"isom\x00\x00\x02\x00isomiso2mp41") +
+            box(b"moov", box(b"mvhd", bytes(100))) + box(b"free", bytes(16)))
+
+
+def tar(members):
+    file = io.BytesIO()
+    with tarfile.open(fileobj=file, mode="w",
+                      format=tarfile.USTAR_FORMAT) as out:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            out.addfile(info, io.BytesIO(data))
+
+    return file.getvalue()
+
+
+def zip_(members):
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as out:
+        for name, data in members.items():
+            out.writestr(name, data)
+
+    return file.getvalue()
+
+
+def samples():
+    members = {
+        "image.png": png(16, 16),
+        "sound.wav": wav(),
+        "video.mp4": mp4(),
+        "text.txt": b"hello\n" * 100,
+    }
+
+    blobs = list(members.values())
+    blobs.append(zip_(members))
+    blobs.append(tar(members))
+    blobs.append(gzip.compress(tar(members)))
+    blobs.append(gzip.compress(zip_(members)))
+    blobs.append(zip_({"nested.zip": zip_(members), "same.png": png(16, 16)}))
+    blobs.append(bytes(range(256)) * 4)
+
+    return blobs
+
+
+def chew(blob, threads=0):
+    return modules.chew(blob, ctx=modules.ChewContext(threads=threads))
+
+
+@pytest.mark.parametrize("threads", [0, 4])
+def test_concurrent_chew(threads):
+    # every chew() call has a context of its own, so running them at the
+    # same time can't mix up their blob IDs or results
+    blobs = samples() * 8
+
+    expected = [chew(blob, threads) for blob in blobs]
+    types = {entry["type"] for entry in expected}
+    assert {"png", "riff", "iso", "zip", "nested", "gzip"} <= types
+
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(chew, blobs, [threads] * len(blobs)))
+
+    assert results == expected
@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT = """
+import sys
+import time
+
+start = time.perf_counter()
+import ruminant.main
+print(time.perf_counter() - start)
+print(" ".join(m for m in sys.modules if m.startswith("ruminant.modules.")))
+"""
+
+
+def test_import():
+    # importing the CLI shouldn't pull in any format module, those are only
+    # loaded once a blob of theirs shows up
+    path = os.environ.get("PYTHONPATH")
+    env = os.environ | {
+        "PYTHONPATH": ROOT if not path else ROOT + os.pathsep + path
+    }
+
+    output = subprocess.run([sys.executable, "-c", IMPORT],
+                            capture_output=True,
+                            check=True,
+                            env=env).stdout.decode("utf-8")
+    wall, modules = output.split("\n")[:2]
+
+    assert modules.split() == []
+
+    # a few dozen milliseconds normally, the bound only catches something
+    # heavy being imported again, even on a slow machine without bytecode
+    assert float(wall) < 1